@@ -18,156 +18,369 @@
 # of [M/2] -1 keys (i.e 1 in this case).
 # For more details on deletion algorithm see
 # Wikipedia article. 
+#
+# Keys inside a node are kept sorted, so every
+# lookup within a node is a binary search with
+# bisect and inserts shift the key list in place.
+# That makes large orders (64-256 keys per node)
+# practical: the tree gets shallower without
+# paying a linear scan per level. For numeric
+# keys, pass an array typecode such as 'q' or 'd'
+# as key_type to store keys in compact typed arrays
+# instead of lists of Python objects.
+#
+# With counted = True every internal node also keeps
+# the number of keys under each of its children.
+# The counts are kept up to date by insert, split,
+# merge and the rotations, and they answer rank,
+# select and count_range in O(log n) instead of
+# walking the keys.
+
+import os
+import pickle
+import random
+import struct
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right, insort
 
 class Node:
+	__slots__ = ('keys', 'values', 'counts', 'leaf', 'next', 'prev')
 
 		# Creating structure of tree
 	def __init__(self, leaf = False):
 		self.keys = []
 		self.values = []
+		self.counts = []
 		self.leaf = leaf
 		self.next = None
+		self.prev = None
 
 # B + Tree
 
 
 class BPlusTree:
-	def __init__(self, degree):
-		self.root = Node(leaf = True)
+	def __init__(self, degree, key_type = None, counted = False):
 		self.degree = degree
+		self.key_type = key_type
+		self.counted = counted
+		self.root = self._new_node(leaf = True)
+
+	# Every node is created here so that the key store
+	# matches key_type
+	def _new_node(self, leaf = False):
+		node = Node(leaf = leaf)
+		if self.key_type is not None:
+			node.keys = array(self.key_type)
+		return node
+
+	# Number of keys under node
+	def _size(self, node):
+		if node.leaf:
+			return len(node.keys)
+		return sum(node.counts)
 
 	# Search for key which
 	# has to be deleted
 	def search(self, key):
-		curr = self.root
-		while not curr.leaf:
+		curr = self._leftmost_leaf(key)
+		i = bisect_left(curr.keys, key)
+		if i == len(curr.keys):
+			curr = curr.next
 			i = 0
-			while i < len(curr.keys):
-				if key < curr.keys[i]:
-					break
-				i += 1
-			curr = curr.values[i]
-		i = 0
-		while i < len(curr.keys):
-			if curr.keys[i] == key:
-				return True
-			i += 1
-		return False
+		return curr is not None and i < len(curr.keys) and curr.keys[i] == key
 
 	# Insert key value pairs
 	def insert(self, key):
 		curr = self.root
 		if len(curr.keys) == 2 * self.degree:
-			new_root = Node()
+			new_root = self._new_node()
 			self.root = new_root
 			new_root.values.append(curr)
+			if self.counted:
+				new_root.counts.append(self._size(curr))
 			self.split(new_root, 0, curr)
 			self.insert_non_full(new_root, key)
 		else:
 			self.insert_non_full(curr, key)
 
 	def insert_non_full(self, curr, key):
-		i = 0
-		while i < len(curr.keys):
-			if key < curr.keys[i]:
-				break
-			i += 1
 		if curr.leaf:
-			curr.keys.insert(i, key)
+			insort(curr.keys, key)
 		else:
+			i = bisect_right(curr.keys, key)
 			if len(curr.values[i].keys) == 2 * self.degree:
 				self.split(curr, i, curr.values[i])
-				if key > curr.keys[i]:
+				if key >= curr.keys[i]:
 					i += 1
+			# counted once the key is in, as a typed key
+			# store can still refuse it at the leaf
 			self.insert_non_full(curr.values[i], key)
+			if self.counted:
+				curr.counts[i] += 1
+
+	# Insert a batch of keys. The batch is sorted (a
+	# sorted batch costs O(n) to check), then each run
+	# of keys that belongs to the same leaf is merged
+	# into it after a single descent. An overfull leaf
+	# is cut into as many leaves as it needs at once,
+	# and internal nodes that gained children are only
+	# split after the whole batch is in, so no node
+	# splits more than once per batch. Equal keys are
+	# all kept, as with insert.
+	def insert_many(self, keys):
+		keys = sorted(keys)
+		if self.key_type is not None:
+			# refuse a bad key before any leaf changes
+			keys = array(self.key_type, keys)
+		touched = set()
+		# (node, upper bound of its keys) from the root
+		# down to the current leaf, and the matching
+		# (parent, child index) pairs
+		stack = [(self.root, None)]
+		path = []
+		i = 0
+		while i < len(keys):
+			key = keys[i]
+			# climb only as far as the next key needs
+			while len(stack) > 1 and stack[-1][1] is not None and key >= stack[-1][1]:
+				stack.pop()
+				path.pop()
+			node, upper = stack[-1]
+			while not node.leaf:
+				j = bisect_right(node.keys, key)
+				if j < len(node.keys):
+					upper = node.keys[j]
+				path.append((node, j))
+				touched.add(id(node))
+				node = node.values[j]
+				stack.append((node, upper))
+			end = len(keys) if upper is None else bisect_left(keys, upper, i)
+			node.keys.extend(keys[i:end])
+			if self.key_type is None:
+				node.keys.sort()
+			else:
+				node.keys = array(self.key_type, sorted(node.keys))
+			self._count_path(path, end - i)
+			if len(node.keys) > 2 * self.degree:
+				pieces = self._split_many(node)
+				if path:
+					self._add_children(path[-1][0], path[-1][1], pieces)
+				else:
+					self._grow_root(pieces)
+			i = end
+		self._grow_root(self._settle(self.root, touched))
+
+	def _keys_like(self, keys):
+		if self.key_type is None:
+			return list(keys)
+		return array(self.key_type, keys)
+
+	# Put the nodes split off child j next to it
+	def _add_children(self, parent, j, pieces):
+		parent.keys[j:j] = self._keys_like(key for key, _ in pieces)
+		parent.values[j + 1:j + 1] = [node for _, node in pieces]
+		if self.counted:
+			parent.counts[j] = self._size(parent.values[j])
+			parent.counts[j + 1:j + 1] = [self._size(node) for _, node in pieces]
+
+	# Cut an overfull node into the fewest nodes that
+	# fit, sharing keys evenly. The node keeps the
+	# first part; the rest come back as (separator,
+	# node) pairs in order.
+	def _split_many(self, node):
+		pieces = []
+		if node.leaf:
+			parts = -(-len(node.keys) // (2 * self.degree))
+			bounds = self._even_bounds(len(node.keys), parts)
+			after = node.next
+			last = node
+			for start, end in bounds[1:]:
+				leaf = self._new_node(leaf = True)
+				leaf.keys = node.keys[start:end]
+				leaf.prev = last
+				last.next = leaf
+				last = leaf
+				pieces.append((leaf.keys[0], leaf))
+			last.next = after
+			if after is not None:
+				after.prev = last
+			node.keys = node.keys[:bounds[0][1]]
+			return pieces
+		parts = -(-len(node.values) // (2 * self.degree + 1))
+		bounds = self._even_bounds(len(node.values), parts)
+		for start, end in bounds[1:]:
+			new_node = self._new_node()
+			new_node.keys = node.keys[start:end - 1]
+			new_node.values = node.values[start:end]
+			new_node.counts = node.counts[start:end]
+			pieces.append((node.keys[start - 1], new_node))
+		cut = bounds[0][1]
+		node.keys = node.keys[:cut - 1]
+		node.values = node.values[:cut]
+		node.counts = node.counts[:cut]
+		return pieces
 
+	def _even_bounds(self, total, parts):
+		size, extra = divmod(total, parts)
+		bounds = []
+		start = 0
+		for part in range(parts):
+			end = start + size + (1 if part < extra else 0)
+			bounds.append((start, end))
+			start = end
+		return bounds
+
+	# Split every overfull internal node touched by a
+	# batch, children first, and hand back the pieces
+	# the node itself was cut into
+	def _settle(self, node, touched):
+		if node.leaf or id(node) not in touched:
+			return []
+		for j in range(len(node.values) - 1, -1, -1):
+			pieces = self._settle(node.values[j], touched)
+			if pieces:
+				self._add_children(node, j, pieces)
+		if len(node.keys) > 2 * self.degree:
+			return self._split_many(node)
+		return []
+
+	# Stack new roots until the top fits in one node
+	def _grow_root(self, pieces):
+		while pieces:
+			root = self._new_node()
+			root.values = [self.root]
+			if self.counted:
+				root.counts = [self._size(self.root)]
+			self._add_children(root, 0, pieces)
+			self.root = root
+			pieces = []
+			if len(root.keys) > 2 * self.degree:
+				pieces = self._split_many(root)
+
+	# A leaf split copies the first key of the right
+	# half up and keeps it in the leaf, so every key
+	# stays reachable from the leaf chain, and links
+	# the new leaf in next to the old one. Internal
+	# splits move the middle key up as before.
 	def split(self, parent, i, node):
-		new_node = Node(leaf = node.leaf)
+		new_node = self._new_node(leaf = node.leaf)
 		parent.values.insert(i + 1, new_node)
-		parent.keys.insert(i, node.keys[self.degree-1])
-		new_node.keys = node.keys[self.degree:]
-		node.keys = node.keys[:self.degree-1]
-		if not new_node.leaf:
+		if node.leaf:
+			new_node.keys = node.keys[self.degree:]
+			node.keys = node.keys[:self.degree]
+			parent.keys.insert(i, new_node.keys[0])
+			new_node.next = node.next
+			if node.next is not None:
+				node.next.prev = new_node
+			new_node.prev = node
+			node.next = new_node
+		else:
+			parent.keys.insert(i, node.keys[self.degree-1])
+			new_node.keys = node.keys[self.degree:]
+			node.keys = node.keys[:self.degree-1]
 			new_node.values = node.values[self.degree:]
 			node.values = node.values[:self.degree]
+			if self.counted:
+				new_node.counts = node.counts[self.degree:]
+				node.counts = node.counts[:self.degree]
+		if self.counted:
+			parent.counts[i] = self._size(node)
+			parent.counts.insert(i + 1, self._size(new_node))
 
-	def steal_from_left(self, parent, i):
-		node = parent.values[i]
-		left_sibling = parent.values[i-1]
-		node.keys.insert(0, parent.keys[i-1])
-		parent.keys[i-1] = left_sibling.keys.pop(-1)
-		if not node.leaf:
-			node.values.insert(0, left_sibling.values.pop(-1))
-
-	def steal_from_right(self, parent, i):
-		node = parent.values[i]
-		right_sibling = parent.values[i + 1]
-		node.keys.append(parent.keys[i])
-		parent.keys[i] = right_sibling.keys.pop(0)
-		if not node.leaf:
-			node.values.append(right_sibling.values.pop(0))
-
-	# Del the given key
+	# Del one copy of the given key. The descent
+	# records the root-to-leaf path, and underflow is
+	# then repaired bottom-up along that path, so no
+	# parent ever has to be searched for again.
 	def delete(self, key):
-		curr = self.root
-		found = False
-		i = 0
-		while i < len(curr.keys):
-			if key == curr.keys[i]:
-				found = True
+		path, leaf = self._find_path(key)
+		i = bisect_left(leaf.keys, key)
+		if i == len(leaf.keys) and leaf.next is not None:
+			# equal keys can start in the next leaf
+			leaf = self._step_right(path)
+			i = 0
+		if i == len(leaf.keys) or leaf.keys[i] != key:
+			return False
+		self._count_path(path, -1)
+		self.delete_from_leaf(i, leaf, path)
+		return True
+
+	# Del every key in [lo, hi) and return how many
+	# were removed. Each pass clears the rest of the
+	# range from one leaf with a single slice, so an
+	# emptied leaf is dropped by one merge and k keys
+	# cost O((k / degree + 1) log n).
+	def delete_range(self, lo, hi):
+		removed = 0
+		while True:
+			path, leaf = self._find_path(lo)
+			i = bisect_left(leaf.keys, lo)
+			if i == len(leaf.keys):
+				if leaf.next is None:
+					break
+				leaf = self._step_right(path)
+				i = 0
+			j = bisect_left(leaf.keys, hi, i)
+			if i == j:
 				break
-			elif key < curr.keys[i]:
+			done = j < len(leaf.keys) or leaf.next is None
+			del leaf.keys[i:j]
+			removed += j - i
+			self._count_path(path, i - j)
+			self._repair(leaf, path)
+			if done:
 				break
-			i += 1
-		if found:
-			if curr.leaf:
-				curr.keys.pop(i)
-			else:
-				pred = curr.values[i]
-				if len(pred.keys) >= self.degree:
-					pred_key = self.get_max_key(pred)
-					curr.keys[i] = pred_key
-					self.delete_from_leaf(pred_key, pred)
-				else:
-					succ = curr.values[i + 1]
-					if len(succ.keys) >= self.degree:
-						succ_key = self.get_min_key(succ)
-						curr.keys[i] = succ_key
-						self.delete_from_leaf(succ_key, succ)
-					else:
-						self.merge(curr, i, pred, succ)
-						self.delete_from_leaf(key, pred)
-			if curr == self.root and not curr.keys:
-				self.root = curr.values[0]
-		else:
-			if curr.leaf:
-				return False
-			else:
-				if len(curr.values[i].keys) < self.degree:
-					if i != 0 and len(curr.values[i-1].keys) >= self.degree:
-						self.steal_from_left(curr, i)
-					elif i != len(curr.keys) and len(curr.values[i + 1].keys) >= self.degree:
-						self.steal_from_right(curr, i)
-					else:
-						if i == len(curr.keys):
-							i -= 1
-						self.merge(curr, i, curr.values[i], curr.values[i + 1])
-				self.delete(key)
-
-	def delete_from_leaf(self, key, leaf):
-		leaf.keys.remove(key)
-		if leaf == self.root or len(leaf.keys) >= self.degree // 2:
-			return
-		parent = self.find_parent(leaf)
-		i = parent.values.index(leaf)
-		if i > 0 and len(parent.values[i-1].keys) > self.degree // 2:
-			self.rotate_right(parent, i)
-		elif i < len(parent.keys) and len(parent.values[i + 1].keys) > self.degree // 2:
-			self.rotate_left(parent, i)
-		else:
-			if i == len(parent.keys):
-				i -= 1
-			self.merge(parent, i, parent.values[i], parent.values[i + 1])
+		return removed
+
+	def _child_index(self, node, key):
+		return bisect_right(node.keys, key)
+
+	# Descend to the leftmost leaf that can hold key,
+	# keeping the (parent, child index) pairs
+	def _find_path(self, key):
+		path = []
+		curr = self.root
+		while not curr.leaf:
+			i = bisect_left(curr.keys, key)
+			path.append((curr, i))
+			curr = curr.values[i]
+		return path, curr
+
+	# Move a recorded path on to the next leaf to the
+	# right and return that leaf
+	def _step_right(self, path):
+		while path:
+			parent, i = path.pop()
+			if i + 1 < len(parent.values):
+				path.append((parent, i + 1))
+				curr = parent.values[i + 1]
+				while not curr.leaf:
+					path.append((curr, 0))
+					curr = curr.values[0]
+				return curr
+		return None
+
+	def _count_path(self, path, delta):
+		if self.counted:
+			for parent, i in path:
+				parent.counts[i] += delta
+
+	def delete_from_leaf(self, i, leaf, path):
+		leaf.keys.pop(i)
+		self._repair(leaf, path)
+
+	# Walk back up the path fixing every node that
+	# fell below degree - 1 keys
+	def _repair(self, node, path):
+		while path and len(node.keys) < self.degree - 1:
+			parent, i = path.pop()
+			self.fix(parent, i)
+			node = parent
 
 	def get_min_key(self, node):
 		while not node.leaf:
@@ -179,46 +392,292 @@ class BPlusTree:
 			node = node.values[-1]
 		return node.keys[-1]
 
-		def get_min_key(self, node):
-			while not node.leaf:
-				node = node.values[0]
-				return node.keys[0]
-
 	def merge(self, parent, i, pred, succ):
-		pred.keys += succ.keys
-		pred.values += succ.values
+		if pred.leaf:
+			pred.keys.extend(succ.keys)
+			pred.next = succ.next
+			if succ.next is not None:
+				succ.next.prev = pred
+		else:
+			pred.keys.append(parent.keys[i])
+			pred.keys.extend(succ.keys)
+			pred.values += succ.values
+			pred.counts += succ.counts
+		if self.counted:
+			parent.counts[i] += parent.counts.pop(i + 1)
 		parent.values.pop(i + 1)
 		parent.keys.pop(i)
 		if parent == self.root and not parent.keys:
 			self.root = pred
 
+	# Top child i of parent back up to the minimum,
+	# borrowing from a sibling that can spare the keys
+	# or merging with one when neither can
 	def fix(self, parent, i):
 		node = parent.values[i]
-		if i > 0 and len(parent.values[i-1].keys) >= self.degree:
-			self.rotate_right(parent, i)
-		elif i < len(parent.keys) and len(parent.values[i + 1].keys) >= self.degree:
-			self.rotate_left(parent, i)
+		need = self.degree - 1 - len(node.keys)
+		if i > 0 and len(parent.values[i-1].keys) - need >= self.degree - 1:
+			self.rotate_right(parent, i, need)
+		elif i < len(parent.keys) and len(parent.values[i + 1].keys) - need >= self.degree - 1:
+			self.rotate_left(parent, i, need)
 		else:
 			if i == len(parent.keys):
 				i -= 1
-			self.merge(parent, i, node, parent.values[i + 1])
+			self.merge(parent, i, parent.values[i], parent.values[i + 1])
 
-	# Balance the tree after deletion
-	def rotate_right(self, parent, i):
+	# Balance the tree after deletion: move count keys
+	# from the left sibling into child i. Leaves just
+	# hand keys over and refresh the separator, internal
+	# nodes rotate them through the parent.
+	def rotate_right(self, parent, i, count = 1):
 		node = parent.values[i]
 		prev = parent.values[i-1]
-		node.keys.insert(0, parent.keys[i-1])
-		parent.keys[i-1] = prev.keys.pop(-1)
-		if not node.leaf:
-			node.values.insert(0, prev.values.pop(-1))
+		cut = len(prev.keys) - count
+		if node.leaf:
+			node.keys[0:0] = prev.keys[cut:]
+			parent.keys[i-1] = node.keys[0]
+			moved = count
+		else:
+			node.keys.insert(0, parent.keys[i-1])
+			node.keys[0:0] = prev.keys[cut + 1:]
+			parent.keys[i-1] = prev.keys[cut]
+			node.values[0:0] = prev.values[cut + 1:]
+			del prev.values[cut + 1:]
+			moved = sum(prev.counts[cut + 1:])
+			node.counts[0:0] = prev.counts[cut + 1:]
+			del prev.counts[cut + 1:]
+		del prev.keys[cut:]
+		if self.counted:
+			parent.counts[i-1] -= moved
+			parent.counts[i] += moved
 
-	def rotate_left(self, parent, i):
+	# Move count keys from the right sibling into
+	# child i
+	def rotate_left(self, parent, i, count = 1):
 		node = parent.values[i]
 		next = parent.values[i + 1]
-		node.keys.append(parent.keys[i])
-		parent.keys[i] = next.keys.pop(0)
-		if not node.leaf:
-			node.values.append(next.values.pop(0))
+		if node.leaf:
+			node.keys.extend(next.keys[:count])
+			del next.keys[:count]
+			parent.keys[i] = next.keys[0]
+			moved = count
+		else:
+			node.keys.append(parent.keys[i])
+			node.keys.extend(next.keys[:count - 1])
+			parent.keys[i] = next.keys[count - 1]
+			del next.keys[:count]
+			node.values.extend(next.values[:count])
+			del next.values[:count]
+			moved = sum(next.counts[:count])
+			node.counts.extend(next.counts[:count])
+			del next.counts[:count]
+		if self.counted:
+			parent.counts[i] += moved
+			parent.counts[i + 1] -= moved
+
+	# Build the tree bottom-up from keys that are
+	# already sorted. Leaves are packed left to right
+	# and linked through next, then every internal
+	# level is built from the level below it in one
+	# pass. The input is consumed one key at a time,
+	# so it can be any iterable (a generator over a
+	# file, a range, ...) and the whole load is O(n).
+	# fill_factor is the fraction of the maximum node
+	# size to pack; leaving some room makes the first
+	# inserts after the load cheaper.
+	def bulk_load(self, sorted_iterable, fill_factor = 1.0):
+		if not 0 < fill_factor <= 1:
+			raise ValueError("fill_factor must be in (0, 1]")
+		max_keys = 2 * self.degree
+		leaf_cap = max(self.degree, int(max_keys * fill_factor))
+
+		# Each level is a list of (smallest key, node)
+		level = []
+		leaf = self._new_node(leaf = True)
+		for key in sorted_iterable:
+			if leaf.keys and key < leaf.keys[-1]:
+				raise ValueError("bulk_load input must be sorted")
+			if len(leaf.keys) == leaf_cap:
+				level.append((leaf.keys[0], leaf))
+				new_leaf = self._new_node(leaf = True)
+				new_leaf.prev = leaf
+				leaf.next = new_leaf
+				leaf = new_leaf
+			leaf.keys.append(key)
+		level.append((leaf.keys[0] if leaf.keys else None, leaf))
+
+		# The last leaf may be underfull, so either fold
+		# it into its left neighbour or share keys evenly
+		if len(level) > 1 and len(leaf.keys) < self.degree - 1:
+			left = level[-2][1]
+			if len(left.keys) + len(leaf.keys) <= max_keys:
+				left.keys.extend(leaf.keys)
+				left.next = None
+				level.pop()
+			else:
+				keys = left.keys + leaf.keys
+				half = len(keys) // 2
+				left.keys = keys[:half]
+				leaf.keys = keys[half:]
+				level[-1] = (leaf.keys[0], leaf)
+
+		child_cap = max(self.degree, int((max_keys + 1) * fill_factor))
+		while len(level) > 1:
+			level = [self._build_parent(group)
+					for group in self._group_level(level, child_cap)]
+		self.root = level[0][1]
+
+	# Cut one level into runs of children for the level
+	# above, keeping the last run at or above the
+	# minimum number of children
+	def _group_level(self, level, cap):
+		groups = [level[i:i + cap] for i in range(0, len(level), cap)]
+		if len(groups) > 1 and len(groups[-1]) < self.degree:
+			tail = groups.pop()
+			groups[-1] += tail
+			if len(groups[-1]) > 2 * self.degree + 1:
+				run = groups.pop()
+				half = len(run) // 2
+				groups += [run[:half], run[half:]]
+		return groups
+
+	def _build_parent(self, group):
+		parent = self._new_node()
+		parent.values = [node for _, node in group]
+		parent.keys.extend(key for key, _ in group[1:])
+		if self.counted:
+			parent.counts = [self._size(node) for node in parent.values]
+		return (group[0][0], parent)
+
+	# Find the leftmost leaf that can hold key. Keys
+	# equal to a separator may sit on either side of
+	# it, so go left on ties and let the caller walk
+	# right along the chain.
+	def _leftmost_leaf(self, key):
+		curr = self.root
+		while not curr.leaf:
+			curr = curr.values[bisect_left(curr.keys, key)]
+		return curr
+
+	# Find the rightmost leaf that can hold key; every
+	# key <= key is in it or to its left
+	def _rightmost_leaf(self, key):
+		curr = self.root
+		while not curr.leaf:
+			curr = curr.values[self._child_index(curr, key)]
+		return curr
+
+	def _first_leaf(self):
+		curr = self.root
+		while not curr.leaf:
+			curr = curr.values[0]
+		return curr
+
+	def _last_leaf(self):
+		curr = self.root
+		while not curr.leaf:
+			curr = curr.values[-1]
+		return curr
+
+	# Walk the leaf chain forwards from position i of
+	# leaf, stopping before the first key >= hi
+	def _scan_forward(self, leaf, i, hi):
+		while leaf is not None:
+			keys = leaf.keys
+			while i < len(keys):
+				if hi is not None and keys[i] >= hi:
+					return
+				yield keys[i]
+				i += 1
+			leaf = leaf.next
+			i = 0
+
+	# Walk the leaf chain backwards from position i of
+	# leaf, stopping at the first key < lo
+	def _scan_backward(self, leaf, i, lo):
+		while leaf is not None:
+			keys = leaf.keys
+			while i >= 0:
+				if lo is not None and keys[i] < lo:
+					return
+				yield keys[i]
+				i -= 1
+			leaf = leaf.prev
+			if leaf is not None:
+				i = len(leaf.keys) - 1
+
+	# Lazily yield every key in [lo, hi) in order, or
+	# in reverse order when reverse is set. Either
+	# bound may be None for an open end. The tree is
+	# descended once and the rest of the scan follows
+	# the leaf chain, so k keys cost O(log n + k).
+	def range(self, lo = None, hi = None, reverse = False):
+		if not reverse:
+			if lo is None:
+				leaf = self._first_leaf()
+				i = 0
+			else:
+				leaf = self._leftmost_leaf(lo)
+				i = bisect_left(leaf.keys, lo)
+			return self._scan_forward(leaf, i, hi)
+		if hi is None:
+			leaf = self._last_leaf()
+			i = len(leaf.keys) - 1
+		else:
+			leaf = self._leftmost_leaf(hi)
+			i = bisect_left(leaf.keys, hi) - 1
+		return self._scan_backward(leaf, i, lo)
+
+	# Lazily yield keys starting at key: every key
+	# >= key in ascending order, or with reverse set
+	# every key <= key in descending order
+	def items_from(self, key, reverse = False):
+		if not reverse:
+			return self.range(key, None)
+		leaf = self._rightmost_leaf(key)
+		i = bisect_right(leaf.keys, key)
+		return self._scan_backward(leaf, i - 1, None)
+
+	def __iter__(self):
+		return self.range()
+
+	def _check_counted(self):
+		if not self.counted:
+			raise ValueError("rank and select need a tree built with counted = True")
+
+	# Number of keys strictly smaller than key
+	def rank(self, key):
+		self._check_counted()
+		before = 0
+		curr = self.root
+		while not curr.leaf:
+			i = bisect_left(curr.keys, key)
+			before += sum(curr.counts[:i])
+			curr = curr.values[i]
+		return before + bisect_left(curr.keys, key)
+
+	# The k-th smallest key, counting from 0
+	def select(self, k):
+		self._check_counted()
+		if not 0 <= k < self._size(self.root):
+			raise IndexError("select index out of range")
+		curr = self.root
+		while not curr.leaf:
+			i = 0
+			while k >= curr.counts[i]:
+				k -= curr.counts[i]
+				i += 1
+			curr = curr.values[i]
+		return curr.keys[k]
+
+	# Number of keys in [lo, hi)
+	def count_range(self, lo, hi):
+		if hi <= lo:
+			return 0
+		return self.rank(hi) - self.rank(lo)
+
+	def __reversed__(self):
+		return self.range(reverse = True)
 
 	# Function to print Tree
 	def print_tree(self):
@@ -232,26 +691,783 @@ class BPlusTree:
 			print()
 			curr_level = next_level
 
+# One published version of a SnapshotBPlusTree. Its
+# nodes are never changed again, so any number of
+# threads can read it without locking. Scans keep
+# their own stack instead of following leaf links,
+# which copy-on-write cannot keep up to date.
+class Snapshot:
+	def __init__(self, root, version):
+		self.root = root
+		self.version = version
+
+	def search(self, key):
+		for found in self.range(key, None):
+			return found == key
+		return False
+
+	def range(self, lo = None, hi = None):
+		stack = []
+		curr = self.root
+		while not curr.leaf:
+			i = 0 if lo is None else bisect_left(curr.keys, lo)
+			stack.append((curr, i))
+			curr = curr.values[i]
+		i = 0 if lo is None else bisect_left(curr.keys, lo)
+		while curr is not None:
+			keys = curr.keys
+			while i < len(keys):
+				if hi is not None and keys[i] >= hi:
+					return
+				yield keys[i]
+				i += 1
+			curr = _next_leaf(stack)
+			i = 0
+
+	def __iter__(self):
+		return self.range()
+
+
+# Advance a (node, child index) stack to the next
+# leaf on the right, or return None at the end
+def _next_leaf(stack):
+	while stack:
+		node, i = stack.pop()
+		if i + 1 < len(node.values):
+			stack.append((node, i + 1))
+			curr = node.values[i + 1]
+			while not curr.leaf:
+				stack.append((curr, 0))
+				curr = curr.values[0]
+			return curr
+	return None
+
+
+# B + Tree with copy-on-write updates. A write copies
+# only the nodes on its root-to-leaf path (and the
+# sibling it borrows from or merges with), then
+# publishes the new version with a single reference
+# assignment. Readers call snapshot() and keep
+# reading that version however many writes follow;
+# nodes of old versions are shared with newer ones
+# and are reclaimed by the garbage collector as soon
+# as no snapshot refers to them.
+class SnapshotBPlusTree:
+	def __init__(self, degree):
+		self.degree = degree
+		self._current = Snapshot(Node(leaf = True), 0)
+		self._write_lock = threading.Lock()
+
+	def snapshot(self):
+		return self._current
+
+	def search(self, key):
+		return self._current.search(key)
+
+	def range(self, lo = None, hi = None):
+		return self._current.range(lo, hi)
+
+	def _publish(self, root):
+		self._current = Snapshot(root, self._current.version + 1)
+
+	# Load sorted keys with BPlusTree.bulk_load and
+	# publish the result as the next version
+	def bulk_load(self, sorted_iterable, fill_factor = 1.0):
+		builder = BPlusTree(self.degree)
+		builder.bulk_load(sorted_iterable, fill_factor)
+		# snapshots do not use the leaf chain, and keeping
+		# it would pin replaced leaves in memory
+		leaf = builder._first_leaf()
+		while leaf is not None:
+			following = leaf.next
+			leaf.next = leaf.prev = None
+			leaf = following
+		with self._write_lock:
+			self._publish(builder.root)
+
+	def _copy(self, node):
+		new_node = Node(leaf = node.leaf)
+		new_node.keys = list(node.keys)
+		new_node.values = list(node.values)
+		return new_node
+
+	def insert(self, key):
+		with self._write_lock:
+			path = []
+			curr = self._current.root
+			while not curr.leaf:
+				i = bisect_right(curr.keys, key)
+				path.append((curr, i))
+				curr = curr.values[i]
+			node = self._copy(curr)
+			insort(node.keys, key)
+			right = None
+			while True:
+				if len(node.keys) > 2 * self.degree:
+					separator, right = self._split(node)
+				if not path:
+					break
+				parent, i = path.pop()
+				parent = self._copy(parent)
+				parent.values[i] = node
+				if right is not None:
+					parent.keys.insert(i, separator)
+					parent.values.insert(i + 1, right)
+					right = None
+				node = parent
+			if right is not None:
+				root = Node()
+				root.keys = [separator]
+				root.values = [node, right]
+				node = root
+			self._publish(node)
+
+	# Split a node that is private to the writer
+	def _split(self, node):
+		right = Node(leaf = node.leaf)
+		half = len(node.keys) // 2
+		if node.leaf:
+			right.keys = node.keys[half:]
+			del node.keys[half:]
+			return right.keys[0], right
+		separator = node.keys[half]
+		right.keys = node.keys[half + 1:]
+		right.values = node.values[half + 1:]
+		del node.keys[half:]
+		del node.values[half + 1:]
+		return separator, right
+
+	def delete(self, key):
+		with self._write_lock:
+			path = []
+			curr = self._current.root
+			while not curr.leaf:
+				i = bisect_left(curr.keys, key)
+				path.append((curr, i))
+				curr = curr.values[i]
+			i = bisect_left(curr.keys, key)
+			if i == len(curr.keys) and path:
+				# equal keys can start in the next leaf
+				curr = _next_leaf(path)
+				i = 0
+			if curr is None or i == len(curr.keys) or curr.keys[i] != key:
+				return False
+			node = self._copy(curr)
+			node.keys.pop(i)
+			while path:
+				parent, i = path.pop()
+				parent = self._copy(parent)
+				parent.values[i] = node
+				if len(node.keys) < self.degree - 1:
+					self._fix(parent, i)
+				node = parent
+			if not node.leaf and not node.keys:
+				node = node.values[0]
+			self._publish(node)
+			return True
+
+	# Repair child i of a private parent, copying the
+	# sibling before touching it
+	def _fix(self, parent, i):
+		if i > 0:
+			j = i - 1
+			parent.values[j] = self._copy(parent.values[j])
+		else:
+			j = i
+			parent.values[j + 1] = self._copy(parent.values[j + 1])
+		left, right = parent.values[j], parent.values[j + 1]
+		extra = 0 if left.leaf else 1
+		if len(left.keys) + len(right.keys) + extra <= 2 * self.degree:
+			if not left.leaf:
+				left.keys.append(parent.keys[j])
+			left.keys += right.keys
+			left.values += right.values
+			parent.keys.pop(j)
+			parent.values.pop(j + 1)
+		elif left.leaf:
+			keys = left.keys + right.keys
+			half = len(keys) // 2
+			left.keys = keys[:half]
+			right.keys = keys[half:]
+			parent.keys[j] = right.keys[0]
+		else:
+			keys = left.keys + [parent.keys[j]] + right.keys
+			values = left.values + right.values
+			half = len(keys) // 2
+			left.keys = keys[:half]
+			left.values = values[:half + 1]
+			parent.keys[j] = keys[half]
+			right.keys = keys[half + 1:]
+			right.values = values[half + 1:]
+
+
+# Append-only log of tree mutations. Each record is
+# [crc32][lsn][op][length][pickled key], and the crc
+# covers everything after it, so a record torn by a
+# crash is detected and ends replay. Records are
+# buffered and written with one fsync per group of
+# group_size records (group commit); group_size = 1
+# syncs every record. Only committed records survive
+# a crash.
+class WriteAheadLog:
+	INSERT = 1
+	DELETE = 2
+	RECORD = struct.Struct('<QBI')
+	CRC = struct.Struct('<I')
+
+	def __init__(self, path, group_size = 64, lsn = 0):
+		self.path = path
+		self.group_size = group_size
+		self.lsn = lsn
+		self.pending = []
+		self.syncs = 0
+		self.file = open(path, 'ab')
+
+	def append(self, op, key):
+		self.lsn += 1
+		payload = pickle.dumps(key)
+		body = self.RECORD.pack(self.lsn, op, len(payload)) + payload
+		self.pending.append(self.CRC.pack(zlib.crc32(body)) + body)
+		if len(self.pending) >= self.group_size:
+			self.commit()
+		return self.lsn
+
+	def commit(self):
+		if not self.pending:
+			return
+		self.file.write(b''.join(self.pending))
+		self.pending.clear()
+		self.file.flush()
+		os.fsync(self.file.fileno())
+		self.syncs += 1
+
+	# Drop every record, once a checkpoint covers them
+	def reset(self):
+		self.pending.clear()
+		self.file.close()
+		self.file = open(self.path, 'wb')
+		self.file.flush()
+		os.fsync(self.file.fileno())
+
+	def close(self):
+		self.commit()
+		self.file.close()
+
+	# Yield (lsn, op, key) for every intact record in
+	# the log at path, then the byte offset where the
+	# intact part ends
+	@classmethod
+	def read(cls, path):
+		if not os.path.exists(path):
+			yield 0
+			return
+		with open(path, 'rb') as f:
+			data = f.read()
+		pos = 0
+		head = cls.CRC.size + cls.RECORD.size
+		while pos + head <= len(data):
+			crc, = cls.CRC.unpack_from(data, pos)
+			lsn, op, length = cls.RECORD.unpack_from(data, pos + cls.CRC.size)
+			end = pos + head + length
+			if end > len(data) or zlib.crc32(data[pos + cls.CRC.size:end]) != crc:
+				break
+			yield lsn, op, pickle.loads(data[pos + head:end])
+			pos = end
+		yield pos
+
+
+# BPlusTree whose mutations go through a write-ahead
+# log in directory. checkpoint() streams the keys in
+# order into a new checkpoint file, swaps it in
+# atomically and empties the log; it also runs on
+# its own every checkpoint_every mutations if that
+# is set. Opening the directory recovers the tree:
+# the latest checkpoint is bulk loaded and only the
+# log records written after it are replayed, so
+# replay time is bounded by the log tail.
+class DurableBPlusTree:
+	CHUNK = 4096
+
+	def __init__(self, directory, degree, group_size = 64, checkpoint_every = None):
+		os.makedirs(directory, exist_ok = True)
+		self.checkpoint_path = os.path.join(directory, 'checkpoint')
+		self.log_path = os.path.join(directory, 'wal')
+		self.degree = degree
+		self.group_size = group_size
+		self.checkpoint_every = checkpoint_every
+		self.since_checkpoint = 0
+		self.recover()
+
+	def recover(self):
+		self.tree = BPlusTree(self.degree)
+		lsn = 0
+		if os.path.exists(self.checkpoint_path):
+			lsn = self._load_checkpoint()
+		self.replayed = 0
+		for record in WriteAheadLog.read(self.log_path):
+			if not isinstance(record, tuple):
+				end = record
+				break
+			if record[0] <= lsn:
+				continue
+			lsn, op, key = record
+			if op == WriteAheadLog.INSERT:
+				self.tree.insert(key)
+			else:
+				self.tree.delete(key)
+			self.replayed += 1
+		# cut off a torn tail so new records follow the
+		# last intact one
+		if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > end:
+			os.truncate(self.log_path, end)
+		self.wal = WriteAheadLog(self.log_path, self.group_size, lsn)
+
+	def _load_checkpoint(self):
+		with open(self.checkpoint_path, 'rb') as f:
+			lsn = pickle.load(f)
+
+			def keys():
+				while True:
+					chunk = pickle.load(f)
+					if not chunk:
+						return
+					yield from chunk
+
+			self.tree.bulk_load(keys())
+		return lsn
+
+	def checkpoint(self):
+		self.wal.commit()
+		temp = self.checkpoint_path + '.tmp'
+		with open(temp, 'wb') as f:
+			pickle.dump(self.wal.lsn, f)
+			chunk = []
+			for key in self.tree:
+				chunk.append(key)
+				if len(chunk) == self.CHUNK:
+					pickle.dump(chunk, f)
+					chunk = []
+			pickle.dump(chunk, f)
+			if chunk:
+				pickle.dump([], f)
+			f.flush()
+			os.fsync(f.fileno())
+		os.replace(temp, self.checkpoint_path)
+		self.wal.reset()
+		self.since_checkpoint = 0
+
+	# Called once a logged mutation has been applied,
+	# so a checkpoint taken here includes it
+	def _applied(self):
+		self.since_checkpoint += 1
+		if self.checkpoint_every and self.since_checkpoint >= self.checkpoint_every:
+			self.checkpoint()
+
+	def insert(self, key):
+		self.wal.append(WriteAheadLog.INSERT, key)
+		self.tree.insert(key)
+		self._applied()
+
+	def delete(self, key):
+		if not self.tree.search(key):
+			return False
+		self.wal.append(WriteAheadLog.DELETE, key)
+		self.tree.delete(key)
+		self._applied()
+		return True
+
+	def search(self, key):
+		return self.tree.search(key)
+
+	def range(self, lo = None, hi = None, reverse = False):
+		return self.tree.range(lo, hi, reverse)
+
+	def __iter__(self):
+		return iter(self.tree)
+
+	def commit(self):
+		self.wal.commit()
+
+	def close(self):
+		self.wal.close()
+
+
+# Assert the structure of a BPlusTree: every leaf at
+# one depth, node sizes within bounds, separators that
+# bound their subtrees, counts that match, and a leaf
+# chain that visits the leaves in order both ways
+def _validate(tree):
+	leaves = []
+	stack = [(tree.root, 0, None, None)]
+	depths = set()
+	while stack:
+		node, depth, lo, hi = stack.pop()
+		assert len(node.keys) <= 2 * tree.degree
+		if node is not tree.root:
+			assert len(node.keys) >= tree.degree - 1
+		assert all(a <= b for a, b in zip(node.keys, node.keys[1:]))
+		assert all((lo is None or lo <= key) and (hi is None or key <= hi) for key in node.keys)
+		if node.leaf:
+			depths.add(depth)
+			leaves.append(node)
+			continue
+		assert len(node.values) == len(node.keys) + 1
+		if tree.counted:
+			assert list(node.counts) == [tree._size(child) for child in node.values]
+		bounds = [lo] + list(node.keys) + [hi]
+		for j in range(len(node.values) - 1, -1, -1):
+			stack.append((node.values[j], depth + 1, bounds[j], bounds[j + 1]))
+	assert len(depths) == 1
+	leaf, prev = tree._first_leaf(), None
+	for expected in leaves:
+		assert leaf is expected and leaf.prev is prev
+		leaf, prev = leaf.next, leaf
+	assert leaf is None
+
+
+# Random insert, insert_many, delete and delete_range,
+# with and without counts and typed keys, against a
+# sorted list, validating the structure as it goes
+def check_bplus_tree(seed = 0):
+	rng = random.Random(seed)
+	for degree in (2, 3, 4, 8):
+		for key_type, counted in ((None, False), (None, True), ('q', True)):
+			tree = BPlusTree(degree, key_type, counted)
+			model = sorted(rng.randrange(300) for _ in range(rng.randrange(200)))
+			tree.bulk_load(model, rng.choice((0.5, 1.0)))
+			for _ in range(150):
+				op = rng.random()
+				key = rng.randrange(300)
+				if key_type is not None and op < 0.05:
+					# a key the typed store refuses changes nothing
+					for bad in (lambda: tree.insert(key + 0.5),
+							lambda: tree.insert_many([key, key + 0.5])):
+						try:
+							bad()
+						except TypeError:
+							pass
+						else:
+							raise AssertionError("typed tree took a float key")
+				elif op < 0.3:
+					tree.insert(key)
+					insort(model, key)
+				elif op < 0.45:
+					batch = [rng.randrange(300) for _ in range(rng.randrange(60))]
+					tree.insert_many(batch)
+					model = sorted(model + batch)
+				elif op < 0.8:
+					assert tree.delete(key) == (key in model)
+					if key in model:
+						model.remove(key)
+				else:
+					hi = key + rng.randrange(40)
+					removed = [k for k in model if key <= k < hi]
+					assert tree.delete_range(key, hi) == len(removed)
+					model = [k for k in model if not key <= k < hi]
+				_validate(tree)
+				assert list(tree) == model and list(reversed(tree)) == model[::-1]
+				assert tree.search(key) == (key in model)
+				hi = key + rng.randrange(50)
+				assert list(tree.range(key, hi)) == [k for k in model if key <= k < hi]
+				if counted:
+					assert tree.rank(key) == bisect_left(model, key)
+					if model:
+						k = rng.randrange(len(model))
+						assert tree.select(k) == model[k]
+	print("B+ tree matches the sorted keys")
+
+
+def _leaf_fill(tree):
+	level = [tree.root]
+	while not level[0].leaf:
+		level = [child for node in level for child in node.values]
+	return sum(len(leaf.keys) for leaf in level) / len(level), len(level)
+
+
+# Compare bulk_load with a loop of insert on the
+# same sorted keys
+def benchmark_bulk_load(n = 200000, degree = 32):
+	start = time.perf_counter()
+	tree = BPlusTree(degree)
+	for key in range(n):
+		tree.insert(key)
+	insert_time = time.perf_counter() - start
+	insert_fill, insert_leaves = _leaf_fill(tree)
+
+	start = time.perf_counter()
+	tree = BPlusTree(degree)
+	tree.bulk_load(range(n))
+	bulk_time = time.perf_counter() - start
+	bulk_fill, bulk_leaves = _leaf_fill(tree)
+
+	print("n = %d, degree = %d" % (n, degree))
+	print("insert loop: %.3fs, %d leaves, %.1f keys/leaf" %
+		(insert_time, insert_leaves, insert_fill))
+	print("bulk_load:   %.3fs, %d leaves, %.1f keys/leaf" %
+		(bulk_time, bulk_leaves, bulk_fill))
+	print("speedup: %.1fx" % (insert_time / bulk_time))
+
+
+def _height(tree):
+	height = 1
+	node = tree.root
+	while not node.leaf:
+		node = node.values[0]
+		height += 1
+	return height
+
+
+# Sweep the node order with list and typed-array
+# key stores: insert and search time, height and
+# the memory held by the finished tree
+def benchmark_node_order(n = 100000, degrees = (2, 4, 8, 16, 32, 64, 128)):
+	keys = list(range(n))
+	random.shuffle(keys)
+	print("n = %d random keys" % n)
+	print("%8s %6s %10s %10s %7s %9s" %
+		("max keys", "store", "insert s", "search s", "height", "bytes/key"))
+	for degree in degrees:
+		for key_type in (None, 'q'):
+			start = time.perf_counter()
+			tree = BPlusTree(degree, key_type)
+			for key in keys:
+				tree.insert(key)
+			insert_time = time.perf_counter() - start
+
+			start = time.perf_counter()
+			for key in keys:
+				tree.search(key)
+			search_time = time.perf_counter() - start
+
+			# fresh key objects, as if read from a stream, so
+			# a list store is charged for the ints it keeps
+			tracemalloc.start()
+			tree = BPlusTree(degree, key_type)
+			for key in keys:
+				tree.insert(key + n)
+			size = tracemalloc.get_traced_memory()[0]
+			tracemalloc.stop()
+
+			print("%8d %6s %10.3f %10.3f %7d %9.1f" %
+				(2 * degree, key_type or "list", insert_time, search_time,
+				_height(tree), size / n))
+
+
+# Compare count_range and select with answering the
+# same questions by walking the keys
+def benchmark_order_statistics(n = 200000, degree = 32, queries = 200):
+	tree = BPlusTree(degree, counted = True)
+	tree.bulk_load(range(n))
+	bounds = [sorted(random.sample(range(n), 2)) for _ in range(queries)]
+
+	start = time.perf_counter()
+	for lo, hi in bounds:
+		tree.count_range(lo, hi)
+	for lo, _ in bounds:
+		tree.select(lo)
+	counted_time = time.perf_counter() - start
+
+	start = time.perf_counter()
+	for lo, hi in bounds:
+		sum(1 for _ in tree.range(lo, hi))
+	for lo, _ in bounds:
+		for i, key in enumerate(tree):
+			if i == lo:
+				break
+	scan_time = time.perf_counter() - start
+
+	print("%d count_range + %d select on %d keys" % (queries, queries, n))
+	print("subtree counts: %.4fs" % counted_time)
+	print("key scan:       %.4fs" % scan_time)
+	print("speedup: %.0fx" % (scan_time / counted_time))
+
+
+# Reader and writer throughput with one global lock
+# around a BPlusTree versus lock-free snapshot reads
+# of a SnapshotBPlusTree while one thread writes
+def benchmark_snapshots(n = 100000, readers = 4, seconds = 1.0, degree = 32):
+	def run(read, write):
+		stop = threading.Event()
+		reads = [0] * readers
+		writes = [0]
+
+		def reader(slot):
+			rng = random.Random(slot)
+			while not stop.is_set():
+				read(rng.randrange(n))
+				reads[slot] += 1
+
+		def writer():
+			rng = random.Random(-1)
+			while not stop.is_set():
+				write(rng.randrange(n))
+				writes[0] += 1
+
+		threads = [threading.Thread(target = reader, args = (slot,))
+				for slot in range(readers)]
+		threads.append(threading.Thread(target = writer))
+		for thread in threads:
+			thread.start()
+		time.sleep(seconds)
+		stop.set()
+		for thread in threads:
+			thread.join()
+		return sum(reads) / seconds, writes[0] / seconds
+
+	locked = BPlusTree(degree)
+	locked.bulk_load(range(0, 2 * n, 2))
+	lock = threading.Lock()
+
+	def locked_read(key):
+		with lock:
+			return locked.search(key)
+
+	def locked_write(key):
+		with lock:
+			locked.insert(key)
+			locked.delete(key)
+
+	cow = SnapshotBPlusTree(degree)
+	cow.bulk_load(range(0, 2 * n, 2))
+
+	def cow_write(key):
+		cow.insert(key)
+		cow.delete(key)
+
+	print("%d readers, 1 writer, %.1fs each" % (readers, seconds))
+	print("global lock:   %9.0f reads/s %8.0f writes/s" % run(locked_read, locked_write))
+	print("copy-on-write: %9.0f reads/s %8.0f writes/s" %
+		run(lambda key: cow.snapshot().search(key), cow_write))
+
+
+# Logged insert throughput with and without group
+# commit, and recovery time as the log tail grows
+def benchmark_wal(n = 2000, degree = 32):
+	for group_size in (1, 16, 256):
+		directory = tempfile.mkdtemp()
+		tree = DurableBPlusTree(directory, degree, group_size)
+		start = time.perf_counter()
+		for key in range(n):
+			tree.insert(key)
+		tree.commit()
+		elapsed = time.perf_counter() - start
+		print("group_size %4d: %8.0f inserts/s, %d fsyncs" %
+			(group_size, n / elapsed, tree.wal.syncs))
+		tree.close()
+
+	for tail in (0, 10000, 50000):
+		directory = tempfile.mkdtemp()
+		tree = DurableBPlusTree(directory, degree, group_size = 4096)
+		for key in range(100000):
+			tree.insert(key)
+		tree.checkpoint()
+		for key in range(100000, 100000 + tail):
+			tree.insert(key)
+		tree.close()
+		start = time.perf_counter()
+		tree = DurableBPlusTree(directory, degree)
+		print("recovery with 100000 checkpointed keys + %5d log records: %.3fs" %
+			(tail, time.perf_counter() - start))
+		tree.close()
+
+
+# insert_many against a loop of insert for batches
+# added to an existing tree, for a sorted micro-batch
+# of new keys and for a batch of random keys
+def benchmark_insert_many(n = 100000, batch = 10000, degree = 32):
+	base = list(range(0, 2 * n, 2))
+	batches = [("sorted", list(range(2 * n, 2 * n + batch))),
+		("random", random.sample(range(1, 2 * n, 2), batch))]
+	for name, keys in batches:
+		tree = BPlusTree(degree)
+		tree.bulk_load(base)
+		start = time.perf_counter()
+		for key in keys:
+			tree.insert(key)
+		loop_time = time.perf_counter() - start
+
+		tree = BPlusTree(degree)
+		tree.bulk_load(base)
+		start = time.perf_counter()
+		tree.insert_many(keys)
+		batch_time = time.perf_counter() - start
+		print("%s batch of %d: insert loop %.4fs, insert_many %.4fs, %.1fx" %
+			(name, batch, loop_time, batch_time, loop_time / batch_time))
+
+
+if __name__ == "__main__":
+	# create a B + tree with degree 3
+	tree = BPlusTree(3)
+
+	# insert some keys
+	tree.insert(1)
+	tree.insert(2)
+	tree.insert(3)
+	tree.insert(4)
+	tree.insert(5)
+	tree.insert(6)
+	tree.insert(7)
+	tree.insert(8)
+	tree.insert(9)
+
+	# print the tree
+	tree.print_tree() # [4] [1, 2, 3] [4, 5, 6, 7, 8, 9]
+
+	# delete a key
+	tree.delete(3)
+
+	# print the tree
+	tree.print_tree() # [4] [1, 2] [4, 5, 6, 7, 8, 9]
+
+	# drop a whole range of keys at once
+	print(tree.delete_range(5, 9)) # 4
+	tree.print_tree() # [4] [1, 2] [4, 9]
+
+	# scan key ranges along the leaf chain
+	print(list(tree.range(2, 7))) # [2, 4]
+	print(list(tree.items_from(6, reverse = True))) # [4, 2, 1]
+
+	# build a tree from sorted keys in one pass
+	tree = BPlusTree(3)
+	tree.bulk_load(range(1, 21))
+	tree.print_tree() # [7, 13, 19] [1, 2, 3, 4, 5, 6] [7, 8, ...] ...
 
-# create a B + tree with degree 3
-tree = BPlusTree(3)
+	# add a whole batch with one descent per leaf
+	tree.insert_many([25, 21, 23, 22, 24])
+	print(list(tree.range(18))) # [18, 19, 20, 21, 22, 23, 24, 25]
 
-# insert some keys
-tree.insert(1)
-tree.insert(2)
-tree.insert(3)
-tree.insert(4)
-tree.insert(5)
-tree.insert(6)
-tree.insert(7)
-tree.insert(8)
-tree.insert(9)
+	# rank, select and count_range from subtree counts
+	tree = BPlusTree(3, counted = True)
+	tree.bulk_load(range(10, 200, 10))
+	print(tree.rank(55), tree.select(4), tree.count_range(30, 100)) # 5 50 7
 
-# print the tree
-tree.print_tree() # [4] [2, 3] [6, 7, 8, 9] [1] [5]
+	# a snapshot keeps its version while the writer moves on
+	tree = SnapshotBPlusTree(3)
+	tree.bulk_load(range(1, 11))
+	before = tree.snapshot()
+	tree.delete(5)
+	tree.insert(42)
+	print(list(before), list(tree.snapshot())) # [1, 2, ..., 10] [1, 2, 3, 4, 6, ..., 10, 42]
 
-# delete a key
-tree.delete(3)
+	# mutations survive a restart through the log
+	directory = tempfile.mkdtemp()
+	tree = DurableBPlusTree(directory, 3)
+	for key in range(1, 11):
+		tree.insert(key)
+	tree.checkpoint()
+	tree.delete(4)
+	tree.close()
+	tree = DurableBPlusTree(directory, 3)
+	print(list(tree), tree.replayed) # [1, 2, 3, 5, ..., 10] 1
+	tree.close()
 
-# print the tree
-tree.print_tree() # [4] [2] [6, 7, 8, 9] [1] [5]
+	check_bplus_tree()
+	# the benchmarks take a while, so they only run
+	# when asked for: python B+_tree_delete.py --bench
+	if "--bench" in sys.argv:
+		benchmark_bulk_load()
+		benchmark_node_order()
+		benchmark_order_statistics()
+		benchmark_snapshots()
+		benchmark_wal()
+		benchmark_insert_many()
@@ -0,0 +1,473 @@
+# Python implementation of a persistent, page-based
+# B+ tree. Every node lives in a fixed-size page of
+# a single file, so the index survives a restart and
+# opening it only reads the header page, no matter
+# how many keys it holds.
+#
+# Layout of the file:
+# 1) Page 0 is the header: magic, page size, root
+# page, number of pages and the head of the free
+# page list.
+# 2) Every other page is a node: a leaf flag, the
+# number of keys, the next and previous leaf, then
+# the keys as signed 64-bit integers and, for
+# internal nodes, the child page numbers.
+#
+# Pages are read through mmap and decoded into nodes
+# that are cached in a bounded LRU buffer pool. A
+# page that was changed is marked dirty and only
+# written back when it is evicted or the tree is
+# flushed. Pages touched by one operation stay in the
+# pool until the operation ends, so a node that is
+# being split or merged is never written half done.
+#
+# search, insert and delete behave like BPlusTree in
+# B+_tree_delete.py: leaves hold every key and splits
+# copy the first key of the right leaf up. insert
+# routes a key equal to a separator to the right;
+# search and delete start from the leftmost leaf that
+# can hold the key and step on to the next leaf, so
+# they find duplicates wherever a split left them.
+# Unlike BPlusTree, keys must be signed 64-bit
+# integers, as that is how pages store them.
+
+import mmap
+import operator
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+
+MAGIC = b'BPT1'
+HEADER = struct.Struct('<4sIqqq')
+NODE_HEADER = struct.Struct('<BxHqq')
+NO_PAGE = -1
+KEY_MIN, KEY_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+class DiskNode:
+	__slots__ = ('page_id', 'leaf', 'keys', 'children', 'next', 'prev')
+
+	def __init__(self, page_id, leaf = False):
+		self.page_id = page_id
+		self.leaf = leaf
+		self.keys = []
+		self.children = []
+		self.next = NO_PAGE
+		self.prev = NO_PAGE
+
+
+# Owns the file and its memory map. Pages are
+# addressed by number and the file grows in chunks
+# so that the map is not rebuilt for every new page.
+class Pager:
+	def __init__(self, path, page_size):
+		exists = os.path.exists(path) and os.path.getsize(path) > 0
+		self.file = open(path, 'r+b' if exists else 'w+b')
+		if not exists:
+			self.file.truncate(page_size)
+		self.map = mmap.mmap(self.file.fileno(), 0)
+		self.page_size = page_size
+
+	def capacity(self):
+		return len(self.map) // self.page_size
+
+	def ensure(self, page_count):
+		if page_count <= self.capacity():
+			return
+		size = max(page_count, 2 * self.capacity()) * self.page_size
+		self.map.close()
+		self.file.truncate(size)
+		self.map = mmap.mmap(self.file.fileno(), 0)
+
+	def read(self, page_id):
+		start = page_id * self.page_size
+		return memoryview(self.map)[start:start + self.page_size]
+
+	def write(self, page_id, data):
+		start = page_id * self.page_size
+		self.map[start:start + len(data)] = data
+
+	def sync(self):
+		self.map.flush()
+
+	def close(self):
+		self.map.close()
+		self.file.close()
+
+
+# LRU cache of decoded nodes sitting on top of the
+# pager. Dirty nodes are encoded back into their page
+# when they are evicted or on flush.
+class BufferPool:
+	def __init__(self, pager, capacity):
+		if capacity < 1:
+			raise ValueError("buffer pool needs at least one page")
+		self.pager = pager
+		self.capacity = capacity
+		self.nodes = OrderedDict()
+		self.dirty = set()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.writes = 0
+
+	def get(self, page_id):
+		node = self.nodes.get(page_id)
+		if node is not None:
+			self.hits += 1
+			self.nodes.move_to_end(page_id)
+			return node
+		self.misses += 1
+		node = decode_node(page_id, self.pager.read(page_id))
+		self.nodes[page_id] = node
+		return node
+
+	def add(self, node):
+		self.nodes[node.page_id] = node
+		self.dirty.add(node.page_id)
+
+	def mark_dirty(self, node):
+		self.dirty.add(node.page_id)
+
+	def discard(self, page_id):
+		self.nodes.pop(page_id, None)
+		self.dirty.discard(page_id)
+
+	# Called between operations: shrink back to the
+	# capacity, writing out dirty victims
+	def trim(self):
+		while len(self.nodes) > self.capacity:
+			page_id, node = self.nodes.popitem(last = False)
+			self.evictions += 1
+			if page_id in self.dirty:
+				self.dirty.discard(page_id)
+				self._write(node)
+
+	def flush(self):
+		for page_id in self.dirty:
+			self._write(self.nodes[page_id])
+		self.dirty.clear()
+
+	def _write(self, node):
+		self.pager.write(node.page_id, encode_node(node))
+		self.writes += 1
+
+	def hit_rate(self):
+		total = self.hits + self.misses
+		return self.hits / total if total else 0.0
+
+
+# key as an int that fits a page, raising at once for
+# anything else rather than when the page is written
+def check_key(key):
+	key = operator.index(key)
+	if not KEY_MIN <= key <= KEY_MAX:
+		raise OverflowError("key %d does not fit in 64 bits" % key)
+	return key
+
+
+def encode_node(node):
+	data = NODE_HEADER.pack(node.leaf, len(node.keys), node.next, node.prev)
+	data += array('q', node.keys).tobytes()
+	if not node.leaf:
+		data += array('q', node.children).tobytes()
+	return data
+
+
+def decode_node(page_id, page):
+	leaf, count, next_page, prev_page = NODE_HEADER.unpack_from(page)
+	node = DiskNode(page_id, bool(leaf))
+	node.next = next_page
+	node.prev = prev_page
+	start = NODE_HEADER.size
+	keys = array('q')
+	keys.frombytes(page[start:start + 8 * count])
+	node.keys = keys.tolist()
+	if not node.leaf:
+		start += 8 * count
+		children = array('q')
+		children.frombytes(page[start:start + 8 * (count + 1)])
+		node.children = children.tolist()
+	return node
+
+
+class DiskBPlusTree:
+	def __init__(self, path, page_size = 4096, pool_size = 256):
+		self.pager = Pager(path, page_size)
+		magic, stored_size, root, page_count, free_head = \
+			HEADER.unpack_from(self.pager.read(0))
+		if magic == MAGIC:
+			if stored_size != page_size:
+				self.pager.close()
+				raise ValueError("file was created with page size %d" % stored_size)
+			self.root = root
+			self.page_count = page_count
+			self.free_head = free_head
+		else:
+			self.root = NO_PAGE
+			self.page_count = 1
+			self.free_head = NO_PAGE
+		self.pool = BufferPool(self.pager, pool_size)
+		payload = page_size - NODE_HEADER.size
+		self.max_leaf_keys = payload // 8
+		self.max_internal_keys = (payload - 8) // 16
+		if self.max_internal_keys < 3:
+			self.pager.close()
+			raise ValueError("page size %d is too small" % page_size)
+		if self.root == NO_PAGE:
+			self.root = self._allocate(leaf = True).page_id
+
+	def _allocate(self, leaf = False):
+		if self.free_head != NO_PAGE:
+			page_id = self.free_head
+			self.free_head = NODE_HEADER.unpack_from(self.pager.read(page_id))[2]
+		else:
+			page_id = self.page_count
+			self.page_count += 1
+			self.pager.ensure(self.page_count)
+		node = DiskNode(page_id, leaf)
+		self.pool.add(node)
+		return node
+
+	# A freed page goes on the free list, linked
+	# through its next field
+	def _free(self, node):
+		self.pool.discard(node.page_id)
+		self.pager.write(node.page_id,
+			NODE_HEADER.pack(True, 0, self.free_head, NO_PAGE))
+		self.free_head = node.page_id
+
+	def _max_keys(self, node):
+		return self.max_leaf_keys if node.leaf else self.max_internal_keys
+
+	# Find the leftmost (or with right set, the
+	# rightmost) leaf that can hold key,
+	# recording the (node, child index) pairs on the
+	# way down
+	def _descend(self, key, right = False):
+		path = []
+		node = self.pool.get(self.root)
+		while not node.leaf:
+			if right:
+				i = bisect_right(node.keys, key)
+			else:
+				i = bisect_left(node.keys, key)
+			path.append((node, i))
+			node = self.pool.get(node.children[i])
+		return path, node
+
+	# Move a recorded path on to the next leaf to the
+	# right and return that leaf
+	def _step_right(self, path):
+		while path:
+			parent, i = path.pop()
+			if i + 1 < len(parent.children):
+				path.append((parent, i + 1))
+				node = self.pool.get(parent.children[i + 1])
+				while not node.leaf:
+					path.append((node, 0))
+					node = self.pool.get(node.children[0])
+				return node
+		return None
+
+	def search(self, key):
+		_, leaf = self._descend(key)
+		i = bisect_left(leaf.keys, key)
+		if i == len(leaf.keys):
+			if leaf.next == NO_PAGE:
+				self.pool.trim()
+				return False
+			leaf = self.pool.get(leaf.next)
+			i = 0
+		found = i < len(leaf.keys) and leaf.keys[i] == key
+		self.pool.trim()
+		return found
+
+	def insert(self, key):
+		key = check_key(key)
+		path, leaf = self._descend(key, right = True)
+		insort(leaf.keys, key)
+		self.pool.mark_dirty(leaf)
+		node = leaf
+		while len(node.keys) > self._max_keys(node):
+			separator, right = self._split(node)
+			if path:
+				parent, i = path.pop()
+			else:
+				parent = self._allocate()
+				parent.children = [node.page_id]
+				self.root = parent.page_id
+				i = 0
+			parent.keys.insert(i, separator)
+			parent.children.insert(i + 1, right.page_id)
+			self.pool.mark_dirty(parent)
+			node = parent
+		self.pool.trim()
+
+	def _split(self, node):
+		right = self._allocate(node.leaf)
+		half = len(node.keys) // 2
+		if node.leaf:
+			right.keys = node.keys[half:]
+			node.keys = node.keys[:half]
+			separator = right.keys[0]
+			right.next = node.next
+			right.prev = node.page_id
+			if node.next != NO_PAGE:
+				after = self.pool.get(node.next)
+				after.prev = right.page_id
+				self.pool.mark_dirty(after)
+			node.next = right.page_id
+		else:
+			separator = node.keys[half]
+			right.keys = node.keys[half + 1:]
+			right.children = node.children[half + 1:]
+			node.keys = node.keys[:half]
+			node.children = node.children[:half + 1]
+		self.pool.mark_dirty(node)
+		return separator, right
+
+	# Delete one copy of key. Underflow is repaired
+	# bottom-up along the recorded path, so no parent
+	# ever has to be searched for.
+	def delete(self, key):
+		path, leaf = self._descend(key)
+		i = bisect_left(leaf.keys, key)
+		if i == len(leaf.keys) and leaf.next != NO_PAGE:
+			# equal keys can start in the next leaf
+			leaf = self._step_right(path)
+			i = 0
+		if i == len(leaf.keys) or leaf.keys[i] != key:
+			self.pool.trim()
+			return False
+		leaf.keys.pop(i)
+		self.pool.mark_dirty(leaf)
+		node = leaf
+		while path and len(node.keys) < self._max_keys(node) // 2:
+			parent, i = path.pop()
+			self._rebalance(parent, i, node)
+			node = parent
+		root = self.pool.get(self.root)
+		if not root.leaf and not root.keys:
+			self.root = root.children[0]
+			self._free(root)
+		self.pool.trim()
+		return True
+
+	# Fix child i of parent by merging it with a
+	# sibling when both fit in one page, otherwise by
+	# sharing keys evenly between the two
+	def _rebalance(self, parent, i, node):
+		if i > 0:
+			j = i - 1
+			left, right = self.pool.get(parent.children[j]), node
+		else:
+			j = i
+			left, right = node, self.pool.get(parent.children[i + 1])
+		extra = 0 if node.leaf else 1
+		if len(left.keys) + len(right.keys) + extra <= self._max_keys(node):
+			if node.leaf:
+				left.keys += right.keys
+				left.next = right.next
+				if right.next != NO_PAGE:
+					after = self.pool.get(right.next)
+					after.prev = left.page_id
+					self.pool.mark_dirty(after)
+			else:
+				left.keys += [parent.keys[j]] + right.keys
+				left.children += right.children
+			parent.keys.pop(j)
+			parent.children.pop(j + 1)
+			self._free(right)
+		elif node.leaf:
+			keys = left.keys + right.keys
+			half = len(keys) // 2
+			left.keys = keys[:half]
+			right.keys = keys[half:]
+			parent.keys[j] = right.keys[0]
+			self.pool.mark_dirty(right)
+		else:
+			keys = left.keys + [parent.keys[j]] + right.keys
+			children = left.children + right.children
+			half = len(keys) // 2
+			left.keys = keys[:half]
+			left.children = children[:half + 1]
+			parent.keys[j] = keys[half]
+			right.keys = keys[half + 1:]
+			right.children = children[half + 1:]
+			self.pool.mark_dirty(right)
+		self.pool.mark_dirty(left)
+		self.pool.mark_dirty(parent)
+
+	def flush(self):
+		self.pool.flush()
+		self.pager.write(0, HEADER.pack(MAGIC, self.pager.page_size,
+			self.root, self.page_count, self.free_head))
+		self.pager.sync()
+
+	def close(self):
+		self.flush()
+		self.pager.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def hit_rate(self):
+		return self.pool.hit_rate()
+
+
+# Build an index on disk, reopen it and report how
+# long the open takes and how well the pool caches
+def benchmark_disk_tree(n = 100000, pool_size = 64):
+	path = os.path.join(tempfile.mkdtemp(), "index.bpt")
+	keys = list(range(n))
+	random.shuffle(keys)
+
+	start = time.perf_counter()
+	with DiskBPlusTree(path, pool_size = pool_size) as tree:
+		for key in keys:
+			tree.insert(key)
+		print("inserted %d keys in %.3fs, hit rate %.1f%%" %
+			(n, time.perf_counter() - start, 100 * tree.hit_rate()))
+
+	start = time.perf_counter()
+	tree = DiskBPlusTree(path, pool_size = pool_size)
+	print("reopened %d-page file in %.6fs" %
+		(tree.page_count, time.perf_counter() - start))
+
+	start = time.perf_counter()
+	found = sum(tree.search(key) for key in keys[:20000])
+	print("%d searches in %.3fs, %d found, hit rate %.1f%%" %
+		(20000, time.perf_counter() - start, found, 100 * tree.hit_rate()))
+	tree.close()
+	os.remove(path)
+
+
+if __name__ == "__main__":
+	path = os.path.join(tempfile.mkdtemp(), "demo.bpt")
+
+	# a tiny page size keeps the demo tree a few levels deep
+	with DiskBPlusTree(path, page_size = 128, pool_size = 8) as tree:
+		for key in range(1, 101):
+			tree.insert(key)
+		tree.delete(50)
+
+	# reopening reads the header only
+	with DiskBPlusTree(path, page_size = 128, pool_size = 8) as tree:
+		print(tree.search(49), tree.search(50)) # True False
+		print("buffer pool hit rate: %.1f%%" % (100 * tree.hit_rate()))
+	os.remove(path)
+
+	# the benchmarks take a while, so they only run
+	# when asked for: python b+_tree_disk.py --bench
+	if "--bench" in sys.argv:
+		benchmark_disk_tree()
@@ -12,8 +12,38 @@
 # at least 1 search key.
 # 4) Insertion overflow occurs when a node
 # contain more than M -1 search key values.
+#
+# Lookups inside a node use bisect on the sorted
+# values and inserts go in place with list.insert
+# rather than rebuilding the lists with slices.
+#
+# BplusTree(order, compressed = True) stores leaves
+# in a compact form for long keys that share
+# prefixes, such as URLs and file paths:
+# 1) Values are front coded: each one is written as
+# the length of the prefix it shares with the value
+# before it plus the rest of its bytes. Values are
+# grouped in short runs whose first value is
+# written in full, so a lookup binary searches the
+# run heads and decodes only one run.
+# 2) The record keys of all values in a leaf sit in
+# one sorted array of 64-bit integers, with an
+# offsets array marking where each posting list
+# starts.
+# Lookups and find work on this form directly, and
+# inserting a new value re-encodes only its run.
+# Record keys must be ints that fit in 64 bits; any
+# other key is refused before the leaf is changed.
 
+import gc
 import math
+import operator
+import random
+import sys
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
 
 # Node creation
 class Node:
@@ -27,30 +57,330 @@ class Node:
 
 	# Insert at the leaf
 	def insert_at_leaf(self, leaf, value, key):
-		if (self.values):
-			temp1 = self.values
-			for i in range(len(temp1)):
-				if (value == temp1[i]):
-					self.keys[i].append(key)
-					break
-				elif (value < temp1[i]):
-					self.values = self.values[:i] + [value] + self.values[i:]
-					self.keys = self.keys[:i] + [[key]] + self.keys[i:]
-					break
-				elif (i + 1 == len(temp1)):
-					self.values.append(value)
-					self.keys.append([key])
-					break
+		i = bisect_left(self.values, value)
+		if (i < len(self.values) and self.values[i] == value):
+			self.keys[i].append(key)
 		else:
-			self.values = [value]
-			self.keys = [[key]]
+			self.values.insert(i, value)
+			self.keys.insert(i, [key])
+
+	def __len__(self):
+		return len(self.values)
+
+	# Smallest value, the separator for a new leaf
+	def first_value(self):
+		return self.values[0]
+
+	# Record keys stored under value, or None
+	def lookup(self, value):
+		i = bisect_left(self.values, value)
+		if (i < len(self.values) and self.values[i] == value):
+			return self.keys[i]
+		return None
+
+	# Merge sorted (value, key) pairs into the leaf,
+	# one at a time when there are only a few
+	def merge_at_leaf(self, items):
+		if (len(items) * 4 < len(self.values)):
+			for value, key in items:
+				self.insert_at_leaf(self, value, key)
+			return
+		self.values, self.keys = _merge_postings(self.values, self.keys, items)
+
+	# Move the upper half of a full leaf into a new
+	# leaf linked after this one
+	def split_leaf(self):
+		return self.split_into(2)[0]
+
+	# Spread the leaf evenly over itself and parts - 1
+	# new leaves linked after it, returning the new ones
+	def split_into(self, parts):
+		bounds = _even_bounds(len(self.values), parts)
+		values, keys = self.values, self.keys
+		self.values = values[:bounds[1]]
+		self.keys = keys[:bounds[1]]
+		pieces = []
+		prev = self
+		for lo, hi in zip(bounds[1:], bounds[2:]):
+			node1 = Node(self.order)
+			node1.check_leaf = True
+			node1.parent = self.parent
+			node1.values = values[lo:hi]
+			node1.keys = keys[lo:hi]
+			node1.nextKey = prev.nextKey
+			prev.nextKey = node1
+			pieces.append(node1)
+			prev = node1
+		return pieces
+
+
+# Cut total entries into parts contiguous pieces, the
+# first ones taking one extra when it does not divide
+def _even_bounds(total, parts):
+	size, extra = divmod(total, parts)
+	bounds = [0]
+	for i in range(parts):
+		bounds.append(bounds[-1] + size + (1 if i < extra else 0))
+	return bounds
+
+
+# Merge sorted (value, key) pairs into parallel value
+# and posting lists, appending keys of values that
+# are already there
+def _merge_postings(values, keys, items):
+	postings = dict(zip(values, keys))
+	for value, key in items:
+		posting = postings.get(value)
+		if (posting is None):
+			postings[value] = [key]
+		else:
+			posting.append(key)
+	# both halves of the dict are sorted, so this is
+	# a single merge
+	merged = sorted(postings)
+	return merged, [postings[value] for value in merged]
+
+
+# Record key as an int for a posting array, raising
+# before anything is stored rather than halfway
+def check_record_key(key):
+	key = operator.index(key)
+	if not -2 ** 63 <= key < 2 ** 63:
+		raise OverflowError("record key %d does not fit in 64 bits" % key)
+	return key
+
+
+def _put_varint(buf, n):
+	while n >= 0x80:
+		buf.append((n & 0x7f) | 0x80)
+		n >>= 7
+	buf.append(n)
+
+
+def _get_varint(blob, pos):
+	n = 0
+	shift = 0
+	while True:
+		byte = blob[pos]
+		pos += 1
+		n |= (byte & 0x7f) << shift
+		if byte < 0x80:
+			return n, pos
+		shift += 7
+
+
+# Length of the common prefix of two byte strings,
+# found by binary search over slice comparisons
+def _shared_prefix(a, b):
+	lo, hi = 0, min(len(a), len(b))
+	while lo < hi:
+		mid = (lo + hi + 1) // 2
+		if a[:mid] == b[:mid]:
+			lo = mid
+		else:
+			hi = mid - 1
+	return lo
+
+
+# Front code a run of sorted byte strings; the first
+# one is written in full
+def _encode_run(values):
+	blob = bytearray()
+	previous = b''
+	for value in values:
+		shared = _shared_prefix(previous, value)
+		_put_varint(blob, shared)
+		_put_varint(blob, len(value) - shared)
+		blob += value[shared:]
+		previous = value
+	return bytes(blob)
+
+
+def _decode_run(blob):
+	values = []
+	pos = 0
+	current = b''
+	while pos < len(blob):
+		# both lengths almost always fit in one byte
+		shared = blob[pos]
+		length = blob[pos + 1]
+		if shared < 0x80 and length < 0x80:
+			pos += 2
+		else:
+			shared, pos = _get_varint(blob, pos)
+			length, pos = _get_varint(blob, pos)
+		current = current[:shared] + blob[pos:pos + length]
+		pos += length
+		values.append(current)
+	return values
+
+
+# Leaf with front-coded values and packed posting
+# lists. Values are kept in runs of about RESTART
+# entries, each coded on its own, so a lookup binary
+# searches the first value of every run and decodes
+# one run, and an insert re-encodes only one run.
+# UTF-8 bytes sort in the same order as the strings
+# they encode, so comparisons are done on the bytes.
+class CompressedLeaf:
+	RESTART = 8
+
+	def __init__(self, order):
+		self.order = order
+		self.nextKey = None
+		self.parent = None
+		self.check_leaf = True
+		self.count = 0
+		self.runs = []
+		self.sizes = array('H')
+		self.postings = array('q')
+		self.offsets = array('I', [0])
+
+	def __len__(self):
+		return self.count
+
+	# The head of the first run is stored in full, so
+	# there is no need to decode the leaf
+	def first_value(self):
+		return self._head(0).decode()
+
+	# First value of run r, which is stored in full
+	def _head(self, r):
+		blob = self.runs[r]
+		_, pos = _get_varint(blob, 0)
+		length, pos = _get_varint(blob, pos)
+		return blob[pos:pos + length]
+
+	# Find where value is or would go: the run, its
+	# decoded values, the position inside the run,
+	# the position in the leaf and whether it is
+	# already there
+	def _locate(self, target):
+		lo, hi = 0, len(self.runs)
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if self._head(mid) <= target:
+				lo = mid + 1
+			else:
+				hi = mid
+		run = max(lo - 1, 0)
+		base = sum(self.sizes[:run])
+		if not self.runs:
+			return run, [], 0, 0, False
+		values = _decode_run(self.runs[run])
+		local = bisect_left(values, target)
+		found = local < len(values) and values[local] == target
+		return run, values, local, base + local, found
+
+	def _values(self):
+		return [value.decode() for run in self.runs for value in _decode_run(run)]
+
+	def _keys(self):
+		return [self.postings[self.offsets[i]:self.offsets[i + 1]]
+			for i in range(self.count)]
+
+	# The postings are packed first, so a bad record
+	# key raises before the leaf is touched
+	def _store(self, values, keys):
+		postings = array('q')
+		offsets = array('I', [0])
+		for posting in keys:
+			postings.extend(sorted(check_record_key(key) for key in posting))
+			offsets.append(len(postings))
+		encoded = [value.encode() for value in values]
+		self.runs = [_encode_run(encoded[i:i + self.RESTART])
+			for i in range(0, len(encoded), self.RESTART)]
+		self.sizes = array('H', [len(encoded[i:i + self.RESTART])
+			for i in range(0, len(encoded), self.RESTART)])
+		self.count = len(values)
+		self.postings = postings
+		self.offsets = offsets
+
+	# Decoded views, for printing and for the parent
+	# separator after a split
+	@property
+	def values(self):
+		return self._values()
+
+	@property
+	def keys(self):
+		return self._keys()
+
+	def insert_at_leaf(self, leaf, value, key):
+		key = check_record_key(key)
+		target = value.encode()
+		run, values, local, i, found = self._locate(target)
+		if found:
+			start, end = self.offsets[i], self.offsets[i + 1]
+			self.postings.insert(bisect_right(self.postings, key, start, end), key)
+		else:
+			if not self.runs:
+				self.runs.append(b'')
+				self.sizes.append(0)
+			values.insert(local, target)
+			if len(values) > 2 * self.RESTART:
+				half = len(values) // 2
+				self.runs[run:run + 1] = [_encode_run(values[:half]),
+					_encode_run(values[half:])]
+				self.sizes[run:run + 1] = array('H', [half, len(values) - half])
+			else:
+				self.runs[run] = _encode_run(values)
+				self.sizes[run] += 1
+			self.count += 1
+			self.postings.insert(self.offsets[i], key)
+			self.offsets.insert(i + 1, self.offsets[i])
+		for j in range(i + 1, self.count + 1):
+			self.offsets[j] += 1
+
+	def lookup(self, value):
+		_, _, _, i, found = self._locate(value.encode())
+		if found:
+			return self.postings[self.offsets[i]:self.offsets[i + 1]]
+		return None
+
+	# Decode once, merge and code the leaf again. A
+	# short run costs less as single inserts, which
+	# each code just one run of the leaf
+	def merge_at_leaf(self, items):
+		# check the whole run, so that none of it goes in
+		# when one key is bad
+		items = [(value, check_record_key(key)) for value, key in items]
+		if (len(items) * self.RESTART < self.count):
+			for value, key in items:
+				self.insert_at_leaf(self, value, key)
+			return
+		self._store(*_merge_postings(self._values(), self._keys(), items))
+
+	def split_leaf(self):
+		return self.split_into(2)[0]
+
+	def split_into(self, parts):
+		bounds = _even_bounds(self.count, parts)
+		values = self._values()
+		keys = self._keys()
+		self._store(values[:bounds[1]], keys[:bounds[1]])
+		pieces = []
+		prev = self
+		for lo, hi in zip(bounds[1:], bounds[2:]):
+			node1 = CompressedLeaf(self.order)
+			node1.parent = self.parent
+			node1._store(values[lo:hi], keys[lo:hi])
+			node1.nextKey = prev.nextKey
+			prev.nextKey = node1
+			pieces.append(node1)
+			prev = node1
+		return pieces
 
 
 # B plus tree
 class BplusTree:
-	def __init__(self, order):
-		self.root = Node(order)
-		self.root.check_leaf = True
+	def __init__(self, order, compressed = False):
+		self.compressed = compressed
+		if compressed:
+			self.root = CompressedLeaf(order)
+		else:
+			self.root = Node(order)
+			self.root.check_leaf = True
 
 	# Insert operation
 	def insert(self, value, key):
@@ -58,46 +388,113 @@ class BplusTree:
 		old_node = self.search(value)
 		old_node.insert_at_leaf(old_node, value, key)
 
-		if (len(old_node.values) == old_node.order):
-			node1 = Node(old_node.order)
-			node1.check_leaf = True
-			node1.parent = old_node.parent
-			mid = int(math.ceil(old_node.order / 2)) - 1
-			node1.values = old_node.values[mid + 1:]
-			node1.keys = old_node.keys[mid + 1:]
-			node1.nextKey = old_node.nextKey
-			old_node.values = old_node.values[:mid + 1]
-			old_node.keys = old_node.keys[:mid + 1]
-			old_node.nextKey = node1
-			self.insert_in_parent(old_node, node1.values[0], node1)
+		if (len(old_node) == old_node.order):
+			node1 = old_node.split_leaf()
+			self.insert_in_parent(old_node, node1.first_value(), node1)
 
 	# Search operation for different operations
 	def search(self, value):
 		current_node = self.root
 		while(current_node.check_leaf == False):
-			temp2 = current_node.values
-			for i in range(len(temp2)):
-				if (value == temp2[i]):
-					current_node = current_node.keys[i + 1]
-					break
-				elif (value < temp2[i]):
-					current_node = current_node.keys[i]
-					break
-				elif (i + 1 == len(current_node.values)):
-					current_node = current_node.keys[i + 1]
-					break
+			i = bisect_right(current_node.values, value)
+			current_node = current_node.keys[i]
 		return current_node
 
+	# Leaf for value together with the smallest
+	# separator above it on the way down, or None
+	# for the rightmost leaf
+	def search_bounded(self, value):
+		current_node = self.root
+		upper = None
+		while(current_node.check_leaf == False):
+			i = bisect_right(current_node.values, value)
+			if (i < len(current_node.values)):
+				upper = current_node.values[i]
+			current_node = current_node.keys[i]
+		return current_node, upper
+
+	# Insert many (value, key) pairs. They are sorted
+	# first, then every run that falls in one leaf is
+	# merged into it with a single descent and split
+	# once into as many leaves as it needs, the new
+	# leaves going into the parent in one splice. A
+	# parent may overflow while the batch goes on, which
+	# searches do not mind; once every leaf is done the
+	# overfull internal nodes are split one level at a
+	# time from the leaves up, so no node splits more
+	# than once per batch.
+	def insert_many(self, items):
+		items = sorted(((str(value), key) for value, key in items),
+			key = itemgetter(0))
+		if self.compressed:
+			items = [(value, check_record_key(key)) for value, key in items]
+		values = [value for value, _ in items]
+		touched = {}
+		i = 0
+		while i < len(items):
+			leaf, upper = self.search_bounded(values[i])
+			end = len(items) if upper is None else bisect_left(values, upper, i)
+			leaf.merge_at_leaf(items[i:end])
+			i = end
+
+			if (len(leaf) >= leaf.order):
+				pieces = leaf.split_into(-(-len(leaf) // (leaf.order - 1)))
+				parent = self.attach(leaf, [node1.first_value() for node1 in pieces], pieces)
+				touched[id(parent)] = parent
+
+		while touched:
+			above = {}
+			for node in touched.values():
+				if (len(node.keys) > node.order):
+					parent = self.attach(node, *self.split_internal(node))
+					above[id(parent)] = parent
+			touched = above
+
+	# Put the nodes split off n, and the separators in
+	# front of them, right after n in its parent, with a
+	# new root above n if it has none. Returns the parent
+	def attach(self, n, separators, pieces):
+		if (self.root == n):
+			parentNode = Node(n.order)
+			parentNode.keys = [n]
+			self.root = parentNode
+			n.parent = parentNode
+		parentNode = n.parent
+		i = parentNode.keys.index(n)
+		parentNode.values[i:i] = separators
+		parentNode.keys[i + 1:i + 1] = pieces
+		for node1 in pieces:
+			node1.parent = parentNode
+		return parentNode
+
+	# Spread an overfull internal node evenly over
+	# itself and as few new nodes of at most order
+	# children as will do. Returns the separators that
+	# move up and the new nodes
+	def split_internal(self, n):
+		bounds = _even_bounds(len(n.keys), -(-len(n.keys) // n.order))
+		values, keys = n.values, n.keys
+		n.values = values[:bounds[1] - 1]
+		n.keys = keys[:bounds[1]]
+		separators = []
+		pieces = []
+		for lo, hi in zip(bounds[1:], bounds[2:]):
+			parentdash = Node(n.order)
+			parentdash.values = values[lo:hi - 1]
+			parentdash.keys = keys[lo:hi]
+			for j in parentdash.keys:
+				j.parent = parentdash
+			separators.append(values[lo - 1])
+			pieces.append(parentdash)
+		return separators, pieces
+
 	# Find the node
 	def find(self, value, key):
 		l = self.search(value)
-		for i, item in enumerate(l.values):
-			if item == value:
-				if key in l.keys[i]:
-					return True
-				else:
-					return False
-		return False
+		posting = l.lookup(value)
+		if (posting is None):
+			return False
+		return key in posting
 
 	# Inserting at the parent
 	def insert_in_parent(self, n, value, ndash):
@@ -114,10 +511,8 @@ class BplusTree:
 		temp3 = parentNode.keys
 		for i in range(len(temp3)):
 			if (temp3[i] == n):
-				parentNode.values = parentNode.values[:i] + \
-					[value] + parentNode.values[i:]
-				parentNode.keys = parentNode.keys[:i +
-												1] + [ndash] + parentNode.keys[i + 1:]
+				parentNode.values.insert(i, value)
+				parentNode.keys.insert(i + 1, ndash)
 				if (len(parentNode.keys) > parentNode.order):
 					parentdash = Node(parentNode.order)
 					parentdash.parent = parentNode.parent
@@ -161,17 +556,120 @@ def printTree(tree):
 				flag = 1
 
 
-record_len = 3
-bplustree = BplusTree(record_len)
-bplustree.insert('5', '33')
-bplustree.insert('15', '21')
-bplustree.insert('25', '31')
-bplustree.insert('35', '41')
-bplustree.insert('45', '10')
+# Bytes held by the leaves: the containers, the
+# strings or encoded runs and the record keys
+def _leaf_bytes(tree):
+	node = tree.root
+	while (node.check_leaf == False):
+		node = node.keys[0]
+	size = 0
+	while node is not None:
+		if isinstance(node, CompressedLeaf):
+			size += sys.getsizeof(node.runs) + sys.getsizeof(node.sizes)
+			size += sum(sys.getsizeof(run) for run in node.runs)
+			size += sys.getsizeof(node.postings) + sys.getsizeof(node.offsets)
+		else:
+			size += sys.getsizeof(node.values) + sys.getsizeof(node.keys)
+			size += sum(sys.getsizeof(value) for value in node.values)
+			for posting in node.keys:
+				size += sys.getsizeof(posting)
+				size += sum(sys.getsizeof(key) for key in posting)
+		node = node.nextKey
+	return size
+
+
+# Leaf bytes per distinct value for a plain and a
+# compressed tree built from the same URL-like corpus
+def benchmark_compression(n = 50000, order = 64):
+	rng = random.Random(1)
+	sections = ["docs", "blog", "products", "support", "api/v2"]
+	corpus = []
+	for i in range(n):
+		corpus.append(("https://www.example.com/%s/%s/item-%06d.html" % (
+			rng.choice(sections), rng.choice("abcdefgh") * 3, i), rng.randrange(10 ** 6)))
+		if rng.random() < 0.3:
+			corpus.append((corpus[-1][0], rng.randrange(10 ** 6)))
+	rng.shuffle(corpus)
+
+	for compressed in (False, True):
+		start = time.perf_counter()
+		tree = BplusTree(order, compressed)
+		for value, key in corpus:
+			tree.insert(value, key)
+		build_time = time.perf_counter() - start
+		size = _leaf_bytes(tree)
+
+		start = time.perf_counter()
+		for value, key in corpus[:10000]:
+			assert tree.find(value, key)
+		find_time = time.perf_counter() - start
+		print("%-10s %6.1f bytes/entry, build %.2fs, 10000 finds %.3fs" % (
+			"compressed" if compressed else "plain", size / n, build_time, find_time))
+
+
+# Best of repeats runs, as one batch takes only tens
+# of milliseconds
+def benchmark_insert_many(n = 100000, batch = 10000, order = 64, repeats = 3):
+	rng = random.Random(2)
+	base = [(rng.randrange(10 ** 9), i) for i in range(n)]
+	start = rng.randrange(10 ** 9)
+	batches = [("random", [(rng.randrange(10 ** 9), i) for i in range(batch)]),
+		("clustered", [(start + i, i) for i in range(batch)])]
+	for compressed in (False, True):
+		for name, extra in batches:
+			timings = []
+			for bulk in (False, True):
+				best = float('inf')
+				for _ in range(repeats):
+					tree = BplusTree(order, compressed)
+					tree.insert_many(base)
+					gc.collect()
+					begin = time.perf_counter()
+					if bulk:
+						tree.insert_many(extra)
+					else:
+						for value, key in extra:
+							tree.insert(value, key)
+					best = min(best, time.perf_counter() - begin)
+				timings.append(best)
+			print("%-10s %-9s %d inserts %.3fs, insert_many %.3fs (%.1fx)" % (
+				"compressed" if compressed else "plain", name, batch,
+				timings[0], timings[1], timings[0] / timings[1]))
+
+
+if __name__ == "__main__":
+	record_len = 3
+	bplustree = BplusTree(record_len)
+	bplustree.insert('5', '33')
+	bplustree.insert('15', '21')
+	bplustree.insert('25', '31')
+	bplustree.insert('35', '41')
+	bplustree.insert('45', '10')
+
+	printTree(bplustree)
+
+	if(bplustree.find('5', '34')):
+		print("Found")
+	else:
+		print("Not found")
+
+	# same lookups on front-coded leaves with integer
+	# record keys
+	urls = BplusTree(4, compressed = True)
+	urls.insert('https://example.com/a/index.html', 1)
+	urls.insert('https://example.com/a/about.html', 2)
+	urls.insert('https://example.com/b/index.html', 3)
+	urls.insert('https://example.com/a/index.html', 4)
+	urls.insert('https://example.com/c/index.html', 5)
+	print(urls.find('https://example.com/a/index.html', 4)) # True
+	print(urls.find('https://example.com/b/about.html', 3)) # False
 
-printTree(bplustree)
+	urls.insert_many([('https://example.com/b/about.html', 6),
+		('https://example.com/a/index.html', 7)])
+	print(urls.find('https://example.com/b/about.html', 6)) # True
 
-if(bplustree.find('5', '34')):
-	print("Found")
-else:
-	print("Not found")
+	# the benchmarks take a while, so they only run
+	# when asked for: python b+_tree_insert.py --bench
+	if "--bench" in sys.argv:
+		benchmark_compression()
+		benchmark_insert_many()
@@ -1,9 +1,70 @@
+import bisect
+import itertools
+import sys
+import time
+
+import numpy as np
+
+
+# Turn tree[1..n], holding plain values, into Fenwick
+# sums in place. Node i adds into its parent
+# i + lowbit(i), and all nodes with the same lowbit
+# are handled by one slice, from the lowest level up.
+def _accumulate(tree, n):
+    step = 1
+    while 2 * step <= n:
+        count = n // (2 * step)
+        tree[2 * step:2 * step * count + 1:2 * step] += \
+            tree[step:step + 2 * step * (count - 1) + 1:2 * step]
+        step *= 2
+
+
+# values as an array of dtype. With no dtype the
+# values stay Python numbers in an object array, so
+# floats are kept and ints never overflow; a numeric
+# dtype is opted into, and values it cannot hold
+# exactly raise TypeError instead of being rounded.
+# Sums in an integer dtype wrap around like numpy.
+def _cast(values, dtype):
+    if dtype is None or np.dtype(dtype) == object:
+        return np.array(values, dtype=object)
+    values = np.asarray(values)
+    dtype = np.dtype(dtype)
+    kind = values.dtype.kind
+    if dtype.kind in 'iu':
+        info = np.iinfo(dtype)
+        exact = kind in 'biu' and (not values.size or
+                                   info.min <= int(values.min()) and int(values.max()) <= info.max)
+    else:
+        exact = kind in 'biuf'
+    if not exact:
+        raise TypeError("%s values do not fit a %s tree" % (values.dtype, dtype))
+    return values.astype(dtype, copy=False)
+
+
+# Storage is an object array of Python numbers by
+# default, as exact as the list this tree used to be;
+# pass a numpy dtype such as np.int64 for the fast
+# typed form.
 class FenwickTree:
-    def __init__(self, n):
+    def __init__(self, n, dtype=None):
         self.n = n
-        self.tree = [0] * (n+1)
+        self.tree = np.zeros(n + 1, dtype=object if dtype is None else dtype)
+
+    # Build from values[0..n-1] (index i holds
+    # values[i-1]) in O(n)
+    @classmethod
+    def from_array(cls, values, dtype=None):
+        values = _cast(values, dtype)
+        ft = cls(len(values), values.dtype)
+        ft.tree[1:] = values
+        _accumulate(ft.tree, ft.n)
+        return ft
 
     def update(self, i, delta):
+        # Python ints are range checked by numpy itself
+        if self.tree.dtype != object and type(delta) is not int:
+            delta = _cast(delta, self.tree.dtype)[()]
         while i <= self.n:
             self.tree[i] += delta
             i += i & -i
@@ -18,27 +79,481 @@ class FenwickTree:
     def range_query(self, i, j):
         return self.get_prefix_sum(j) - self.get_prefix_sum(i-1)
 
+    # Add deltas[k] at indices[k] for the whole batch.
+    # Small batches climb the tree one level per step
+    # for every index at once; a batch large enough to
+    # touch most nodes is summed into a dense array and
+    # accumulated in O(n) instead.
+    def update_many(self, indices, deltas):
+        indices = np.asarray(indices, dtype=np.int64)
+        deltas = np.broadcast_to(_cast(deltas, self.tree.dtype), indices.shape)
+        if len(indices) * max(self.n.bit_length(), 1) > self.n:
+            dense = np.zeros_like(self.tree)
+            np.add.at(dense, indices, deltas)
+            _accumulate(dense, self.n)
+            self.tree += dense
+            return
+        indices = indices.copy()
+        while len(indices):
+            np.add.at(self.tree, indices, deltas)
+            indices += indices & -indices
+            keep = indices <= self.n
+            indices, deltas = indices[keep], deltas[keep]
+
+    # Prefix sums for a batch of indices. tree[0] is
+    # always 0, so finished indices can stay at 0
+    # while the others keep descending.
+    def prefix_sums(self, indices):
+        indices = np.array(indices, dtype=np.int64)
+        sums = np.zeros(indices.shape, dtype=self.tree.dtype)
+        while indices.any():
+            sums += self.tree[indices]
+            indices -= indices & -indices
+        return sums
+
+    def range_queries(self, lo, hi):
+        lo = np.asarray(lo, dtype=np.int64)
+        hi = np.asarray(hi, dtype=np.int64)
+        sums = self.prefix_sums(np.concatenate([hi, lo - 1]))
+        return sums[:len(hi)] - sums[len(hi):]
+
+    # Smallest index whose prefix sum is at least s, or
+    # n + 1 if the total is below s, for non-negative
+    # values. Walks down from the highest power of two:
+    # tree[pos + step] is the sum of the next step
+    # values, so whole blocks are skipped while they
+    # stay below what is left of s.
+    def find_by_prefix(self, s):
+        pos = 0
+        step = 1 << (self.n.bit_length() - 1) if self.n else 0
+        while step:
+            if pos + step <= self.n and self.tree[pos + step] < s:
+                pos += step
+                s -= self.tree[pos]
+            step >>= 1
+        return pos + 1
+
+    # find_by_prefix for a batch of thresholds, which may
+    # be fractional whatever the dtype of the tree
+    def find_by_prefixes(self, thresholds):
+        thresholds = np.asarray(thresholds)
+        left = thresholds.astype(np.result_type(self.tree.dtype, thresholds))
+        pos = np.zeros(left.shape, dtype=np.int64)
+        step = 1 << (self.n.bit_length() - 1) if self.n else 0
+        while step:
+            ahead = pos + step
+            block = self.tree[np.minimum(ahead, self.n)]
+            skip = (ahead <= self.n) & (block < left)
+            pos[skip] = ahead[skip]
+            left[skip] -= block[skip]
+            step >>= 1
+        return pos + 1
+
+    # k indices drawn with probability proportional to
+    # their value. A draw s in (0, total] lands on the
+    # index whose block of the prefix sums contains it.
+    def sample(self, k, rng=None):
+        rng = np.random.default_rng() if rng is None else rng
+        total = self.get_prefix_sum(self.n)
+        if isinstance(total, (int, np.integer)):
+            draws = rng.integers(1, total + 1, k)
+        else:
+            draws = total * (1.0 - rng.random(k))
+        return self.find_by_prefixes(draws)
+
+
+# Range add and range sum with two Fenwick trees over
+# the difference array d of the values. The prefix sum
+# up to i is i * sum(d[1..i]) - sum(d[j] * (j-1)), so
+# b1 keeps d and b2 keeps d[j] * (j-1). Both are sized
+# n + 1 so that the end of a range at n has a slot.
+class RangeFenwickTree:
+    def __init__(self, n, dtype=None):
+        self.n = n
+        self.b1 = FenwickTree(n + 1, dtype)
+        self.b2 = FenwickTree(n + 1, dtype)
+
+    @classmethod
+    def from_array(cls, values, dtype=None):
+        values = _cast(values, dtype)
+        rft = cls(len(values), values.dtype)
+        diff = np.zeros(len(values) + 1, dtype=values.dtype)
+        diff[:-1] = np.diff(values, prepend=0)
+        rft.b1 = FenwickTree.from_array(diff, diff.dtype)
+        rft.b2 = FenwickTree.from_array(diff * np.arange(len(diff), dtype=diff.dtype),
+                                        diff.dtype)
+        return rft
+
+    # Add delta to every index in [l, r]
+    def range_add(self, l, r, delta):
+        self.b1.update(l, delta)
+        self.b1.update(r + 1, -delta)
+        self.b2.update(l, delta * (l - 1))
+        self.b2.update(r + 1, -delta * r)
+
+    def get_prefix_sum(self, i):
+        return self.b1.get_prefix_sum(i) * i - self.b2.get_prefix_sum(i)
+
+    def range_query(self, l, r):
+        return self.get_prefix_sum(r) - self.get_prefix_sum(l - 1)
+
+    def range_add_many(self, lo, hi, deltas):
+        lo = np.asarray(lo, dtype=np.int64)
+        hi = np.asarray(hi, dtype=np.int64)
+        deltas = np.broadcast_to(_cast(deltas, self.b1.tree.dtype), lo.shape)
+        self.b1.update_many(np.concatenate([lo, hi + 1]),
+                            np.concatenate([deltas, -deltas]))
+        self.b2.update_many(np.concatenate([lo, hi + 1]),
+                            np.concatenate([deltas * (lo - 1), -deltas * hi]))
+
+    def prefix_sums(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        return self.b1.prefix_sums(indices) * indices - self.b2.prefix_sums(indices)
+
+    def range_queries(self, lo, hi):
+        lo = np.asarray(lo, dtype=np.int64)
+        hi = np.asarray(hi, dtype=np.int64)
+        sums = self.prefix_sums(np.concatenate([hi, lo - 1]))
+        return sums[:len(hi)] - sums[len(hi):]
+
+
+# Random range adds and range sums, one at a time and
+# in batches, against a plain array
+def check_range_fenwick(n=300, rounds=200, seed=0):
+    rng = np.random.default_rng(seed)
+    model = rng.integers(-50, 50, n)
+    rft = RangeFenwickTree.from_array(model)
+    for _ in range(rounds):
+        batch = int(rng.integers(1, 20))
+        lo = rng.integers(1, n + 1, batch)
+        hi = np.maximum(lo, rng.integers(1, n + 1, batch))
+        deltas = rng.integers(-20, 20, batch)
+        if rng.random() < 0.5:
+            rft.range_add_many(lo, hi, deltas)
+        else:
+            for l, r, delta in zip(lo.tolist(), hi.tolist(), deltas.tolist()):
+                rft.range_add(l, r, delta)
+        for l, r, delta in zip(lo.tolist(), hi.tolist(), deltas.tolist()):
+            model[l - 1:r] += delta
+
+        lo = rng.integers(1, n + 1, batch)
+        hi = np.maximum(lo, rng.integers(1, n + 1, batch))
+        expected = [model[l - 1:r].sum() for l, r in zip(lo.tolist(), hi.tolist())]
+        assert np.array_equal(rft.range_queries(lo, hi), expected)
+        l, r = int(lo[0]), int(hi[0])
+        assert rft.range_query(l, r) == expected[0]
+    print("range fenwick matches the plain array")
+
+
+# Fenwick tree over a d-dimensional grid, 1-based in
+# every axis, stored as one flat array of the padded
+# shape (n1 + 1, ..., nd + 1) so that coordinate 0
+# is an always-zero sink like tree[0] in 1D. A point
+# update or prefix sum visits the product of the
+# per-axis chains, O(log^d n) nodes. With sparse=True
+# the nodes live in a dict keyed by flat offset, for
+# huge grids of which few cells are ever touched.
+class FenwickTreeND:
+    def __init__(self, shape, dtype=None, sparse=False):
+        self.shape = tuple(shape)
+        self.strides = []
+        stride = 1
+        for n in reversed(self.shape):
+            self.strides.insert(0, stride)
+            stride *= n + 1
+        self.sparse = sparse
+        if sparse:
+            self.tree = {}
+        else:
+            self.tree = np.zeros(stride, dtype=object if dtype is None else dtype)
+
+    # Dense build in O(cells): the 1D build run along
+    # each axis in turn
+    @classmethod
+    def from_array(cls, values, dtype=None):
+        values = _cast(values, dtype)
+        ft = cls(values.shape, values.dtype)
+        grid = ft.tree.reshape([n + 1 for n in ft.shape])
+        grid[(slice(1, None),) * values.ndim] = values
+        for axis, n in enumerate(ft.shape):
+            _accumulate(np.moveaxis(grid, axis, 0), n)
+        return ft
+
+    # Flat offsets of the nodes a point touches,
+    # climbing for updates and descending for sums
+    def _nodes(self, point, up):
+        offsets = [0]
+        for i, n, stride in zip(point, self.shape, self.strides):
+            chain = []
+            while 0 < i <= n:
+                chain.append(i * stride)
+                if up:
+                    i += i & -i
+                else:
+                    i -= i & -i
+            offsets = [offset + step for offset in offsets for step in chain]
+        return offsets
+
+    def update(self, point, delta):
+        offsets = self._nodes(point, True)
+        if self.sparse:
+            for offset in offsets:
+                self.tree[offset] = self.tree.get(offset, 0) + delta
+        else:
+            if self.tree.dtype != object and type(delta) is not int:
+                delta = _cast(delta, self.tree.dtype)[()]
+            self.tree[offsets] += delta
+
+    def get_prefix_sum(self, point):
+        offsets = self._nodes(point, False)
+        if self.sparse:
+            return sum(self.tree.get(offset, 0) for offset in offsets)
+        return self.tree[offsets].sum()
+
+    # Sum over the box lo..hi, inclusive in every axis,
+    # by inclusion-exclusion over its 2^d corners
+    def range_query(self, lo, hi):
+        total = 0
+        for corner in itertools.product(*zip(hi, [l - 1 for l in lo])):
+            sign = (-1) ** sum(c != h for c, h in zip(corner, hi))
+            total += sign * self.get_prefix_sum(corner)
+        return total
+
+    # Walk the node chains of a whole batch of points,
+    # one axis at a time and one level per step, calling
+    # visit(offsets, rows) once every axis has an index.
+    # rows says which point each offset belongs to.
+    def _walk(self, points, up, visit, axis=0, offsets=None, rows=None):
+        if offsets is None:
+            offsets = np.zeros(len(points), dtype=np.int64)
+            rows = np.arange(len(points))
+        if axis == len(self.shape):
+            visit(offsets, rows)
+            return
+        n, stride = self.shape[axis], self.strides[axis]
+        idx = points[rows, axis]
+        keep = (idx > 0) & (idx <= n)
+        idx, offsets, rows = idx[keep], offsets[keep], rows[keep]
+        while len(idx):
+            self._walk(points, up, visit, axis + 1, offsets + idx * stride, rows)
+            if up:
+                idx = idx + (idx & -idx)
+                keep = idx <= n
+            else:
+                idx = idx - (idx & -idx)
+                keep = idx > 0
+            idx, offsets, rows = idx[keep], offsets[keep], rows[keep]
+
+    # points is a (k, d) array of 1-based coordinates.
+    # The sparse mode has no vectorized form and adds
+    # one point at a time.
+    def update_many(self, points, deltas):
+        points = np.asarray(points, dtype=np.int64).reshape(-1, len(self.shape))
+        if self.sparse:
+            deltas = np.broadcast_to(deltas, len(points))
+            for point, delta in zip(points.tolist(), deltas.tolist()):
+                self.update(point, delta)
+            return
+        deltas = np.broadcast_to(_cast(deltas, self.tree.dtype), len(points))
+
+        def visit(offsets, rows):
+            np.add.at(self.tree, offsets, deltas[rows])
+        self._walk(points, True, visit)
+
+    def prefix_sums(self, points):
+        points = np.asarray(points, dtype=np.int64).reshape(-1, len(self.shape))
+        if self.sparse:
+            return np.array([self.get_prefix_sum(point) for point in points.tolist()])
+        sums = np.zeros(len(points), dtype=self.tree.dtype)
+
+        def visit(offsets, rows):
+            sums[rows] += self.tree[offsets]
+        self._walk(points, False, visit)
+        return sums
+
+    def range_queries(self, lo, hi):
+        lo = np.asarray(lo, dtype=np.int64).reshape(-1, len(self.shape))
+        hi = np.asarray(hi, dtype=np.int64).reshape(-1, len(self.shape))
+        sums = 0
+        for corner in itertools.product((False, True), repeat=len(self.shape)):
+            corner = np.array(corner)
+            sign = (-1) ** int(corner.sum())
+            sums = sums + sign * self.prefix_sums(np.where(corner, lo - 1, hi))
+        return sums
+
+
+# Random point updates and box sums on 2D and 3D grids,
+# dense and sparse, against numpy slicing
+def check_fenwick_nd(seed=0):
+    rng = np.random.default_rng(seed)
+    for shape in [(13, 7), (6, 5, 9)]:
+        model = rng.integers(-20, 20, shape)
+        trees = [FenwickTreeND.from_array(model), FenwickTreeND(shape, sparse=True)]
+        for point in itertools.product(*[range(1, n + 1) for n in shape]):
+            trees[1].update(point, model[tuple(i - 1 for i in point)])
+        for _ in range(50):
+            k = int(rng.integers(1, 10))
+            points = np.stack([rng.integers(1, n + 1, k) for n in shape], axis=1)
+            deltas = rng.integers(-9, 9, k)
+            for tree in trees:
+                if rng.random() < 0.5:
+                    tree.update_many(points, deltas)
+                else:
+                    for point, delta in zip(points.tolist(), deltas.tolist()):
+                        tree.update(point, delta)
+            np.add.at(model, tuple((points - 1).T), deltas)
+
+            lo = np.stack([rng.integers(1, n + 1, k) for n in shape], axis=1)
+            hi = np.maximum(lo, np.stack([rng.integers(1, n + 1, k) for n in shape], axis=1))
+            expected = [model[tuple(slice(l - 1, h) for l, h in zip(a, b))].sum()
+                        for a, b in zip(lo.tolist(), hi.tolist())]
+            for tree in trees:
+                assert np.array_equal(tree.range_queries(lo, hi), expected)
+                assert tree.range_query(lo[0].tolist(), hi[0].tolist()) == expected[0]
+    print("fenwick nd matches the plain grids")
+
+
+# Rectangle sums on a rows x cols heatmap: one
+# FenwickTree per row against one 2D tree
+def benchmark_fenwick_nd(rows=500, cols=2000, queries=2000):
+    rng = np.random.default_rng(2)
+    grid = rng.integers(0, 100, (rows, cols))
+    lo = np.stack([rng.integers(1, rows + 1, queries),
+                   rng.integers(1, cols + 1, queries)], axis=1)
+    hi = np.maximum(lo, np.stack([rng.integers(1, rows + 1, queries),
+                                  rng.integers(1, cols + 1, queries)], axis=1))
+
+    per_row = [FenwickTree.from_array(row, np.int64) for row in grid]
+    start = time.perf_counter()
+    answers = [sum(per_row[r].range_query(c0, c1) for r in range(r0 - 1, r1))
+               for (r0, c0), (r1, c1) in zip(lo.tolist(), hi.tolist())]
+    rowwise = time.perf_counter() - start
+
+    ft = FenwickTreeND.from_array(grid, np.int64)
+    start = time.perf_counter()
+    single = [ft.range_query(a, b) for a, b in zip(lo.tolist(), hi.tolist())]
+    one_by_one = time.perf_counter() - start
+    start = time.perf_counter()
+    batched = ft.range_queries(lo, hi)
+    many = time.perf_counter() - start
+    assert np.array_equal(answers, single) and np.array_equal(answers, batched)
+    print("%d rectangle sums on %dx%d: per-row trees %.2fs, 2D tree %.3fs, batched %.4fs" % (
+        queries, rows, cols, rowwise, one_by_one, many))
+
+
+def benchmark_fenwick(n=1000000, batch=200000):
+    rng = np.random.default_rng(1)
+    values = rng.integers(-100, 100, n)
+    indices = rng.integers(1, n + 1, batch)
+    deltas = rng.integers(-100, 100, batch)
+    lo = rng.integers(1, n + 1, batch)
+    hi = np.maximum(lo, rng.integers(1, n + 1, batch))
+
+    start = time.perf_counter()
+    slow = FenwickTree(n, np.int64)
+    for i in range(1, n + 1):
+        slow.update(i, values[i - 1])
+    build_loop = time.perf_counter() - start
+    start = time.perf_counter()
+    fast = FenwickTree.from_array(values, np.int64)
+    build_fast = time.perf_counter() - start
+    assert np.array_equal(slow.tree, fast.tree)
+    print("build %d: update loop %.2fs, from_array %.4fs" % (
+        n, build_loop, build_fast))
+
+    start = time.perf_counter()
+    for i, delta in zip(indices.tolist(), deltas.tolist()):
+        slow.update(i, delta)
+    answers = [slow.range_query(i, j) for i, j in zip(lo.tolist(), hi.tolist())]
+    loop = time.perf_counter() - start
+    start = time.perf_counter()
+    fast.update_many(indices, deltas)
+    batched = fast.range_queries(lo, hi)
+    many = time.perf_counter() - start
+    assert np.array_equal(answers, batched)
+    print("%d updates + %d range queries: loop %.2fs, batched %.4fs (%.0fx)" % (
+        batch, batch, loop, many, loop / many))
+
+
+# Lower-bound searches on random weights: binary
+# search over get_prefix_sum, binary lifting and the
+# batched form
+def benchmark_find_by_prefix(n=1000000, queries=20000):
+    rng = np.random.default_rng(3)
+    ft = FenwickTree.from_array(rng.integers(0, 1000, n), np.int64)
+    total = int(ft.get_prefix_sum(n))
+    thresholds = rng.integers(1, total + 1, queries)
+    # fractional thresholds, as percentiles of the total
+    # give, must agree between the scalar and batched forms
+    fractions = total * rng.random(queries)
+
+    start = time.perf_counter()
+    searched = [bisect.bisect_left(range(1, n + 1), s, key=ft.get_prefix_sum)
+                for s in thresholds.tolist()]
+    bisected = time.perf_counter() - start
+    start = time.perf_counter()
+    lifted = [ft.find_by_prefix(s) for s in thresholds.tolist()]
+    lifting = time.perf_counter() - start
+    start = time.perf_counter()
+    batched = ft.find_by_prefixes(thresholds)
+    many = time.perf_counter() - start
+    assert (np.array(searched) + 1 == lifted).all() and np.array_equal(lifted, batched)
+    lifted = [ft.find_by_prefix(s) for s in fractions[:2000].tolist()]
+    assert np.array_equal(lifted, ft.find_by_prefixes(fractions[:2000]))
+    print("%d lower bounds: bisect %.2fs, find_by_prefix %.2fs, batched %.4fs" % (
+        queries, bisected, lifting, many))
+
+if __name__ == "__main__":
+    # Example usage
+    arr = [3, 2, -1, 6, 5, 4, -3, 3, 7, 2, 3]
+    n = len(arr)
+
+    # Create a FenwickTree instance
+    ft = FenwickTree(n)
+
+    # Build the Fenwick tree
+    for i in range(1, n+1):
+        ft.update(i, arr[i-1])
+
+    # Test prefix sum
+    print(ft.get_prefix_sum(5))  # Output: 15
 
-# Example usage
-arr = [3, 2, -1, 6, 5, 4, -3, 3, 7, 2, 3]
-n = len(arr)
+    # Test range query
+    print(ft.range_query(3, 8))  # Output: 13
 
-# Create a FenwickTree instance
-ft = FenwickTree(n)
+    # Update value at index 4
+    ft.update(4, 1)
 
-# Build the Fenwick tree
-for i in range(1, n+1):
-    ft.update(i, arr[i-1])
+    # Test range query after updating
+    print(ft.range_query(3, 8))  # Output: 14
 
-# Test prefix sum
-print(ft.get_prefix_sum(5))  # Output: 15
+    # Same tree built in O(n) and queried in batches
+    ft = FenwickTree.from_array(arr)
+    ft.update_many([4], [1])
+    print(ft.range_queries([3, 1], [8, 5]))  # Output: [15 16]
 
-# Test range query
-print(ft.range_query(3, 8))  # Output: 13
+    # Add 2 to indices 3..6, then sum 1..5 and 4..11
+    rft = RangeFenwickTree.from_array(arr)
+    rft.range_add(3, 6, 2)
+    print(rft.range_query(1, 5))  # Output: 21
+    print(rft.range_queries([4], [11]))  # Output: [33]
 
-# Update value at index 4
-ft.update(4, 1)
+    # Index holding the 5th unit of weight, and a few
+    # weighted draws
+    weights = FenwickTree.from_array([1, 0, 3, 2, 4])
+    print(weights.find_by_prefix(5))  # Output: 4
+    print(weights.sample(5, np.random.default_rng(0)))
 
-# Test range query after updating
-print(ft.range_query(3, 8))  # Output: 14
+    # Counts on a 3 x 4 grid of (time bucket, region)
+    heat = FenwickTreeND((3, 4))
+    heat.update_many([(1, 2), (2, 2), (3, 4)], [5, 1, 7])
+    print(heat.range_query((1, 1), (2, 3)))  # Output: 6
 
+    check_range_fenwick()
+    check_fenwick_nd()
+    # the benchmarks take a while, so they only run
+    # when asked for: python fenwick_trees.py --bench
+    if "--bench" in sys.argv:
+        benchmark_fenwick()
+        benchmark_fenwick_nd()
+        benchmark_find_by_prefix()
@@ -0,0 +1,238 @@
+# Python Program to implement segment trees over huge key spaces.
+# The trees in segment_tree_iterative.py and segmenttree_recursive.py
+# allocate one slot per possible key up front, which is impossible for
+# keys such as 64 bit timestamps. Two ways around that:
+#
+# DynamicSegmentTree covers the key range [lo, hi) with the usual halving
+# of ranges, but creates nodes only for keys that are updated. Missing
+# children stand for ranges where every key still holds the identity, and
+# a key with a subtree to itself sits in a single node at the top of it,
+# so the tree has about two nodes per touched key whatever the size of
+# the range. Nodes are rows in a pool of arrays, as in
+# segment_tree_persistent.py.
+#
+# CompressedSegmentTree is for when every key is known in advance: the
+# sorted distinct keys are numbered 0..k-1, and a SegmentTree over those
+# k positions does the work, a bisect away from any key.
+#
+# Query ranges are half open, as in segment_tree_iterative.py.
+
+import random
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from sys import maxsize
+
+import numpy as np
+
+from segment_tree_iterative import SegmentTree
+
+INT_MIN = -maxsize
+
+
+class DynamicSegmentTree:
+	def __init__(self, lo, hi, combine=max, identity=INT_MIN):
+		self.lo = lo
+		self.hi = hi
+		self.combine = combine
+		self.identity = identity
+		# node 0 is the root; child 0 means no child, as
+		# the root is nobody's child. A node with a key
+		# holds just that key, wherever it is in its range.
+		self.left = array('i', [0])
+		self.right = array('i', [0])
+		self.value = [identity]
+		self.keys = [None]
+
+	def __len__(self):
+		return len(self.value)
+
+	def _node(self, key, value):
+		self.left.append(0)
+		self.right.append(0)
+		self.value.append(value)
+		self.keys.append(key)
+		return len(self.value) - 1
+
+	def _get(self, node):
+		return self.value[node] if node else self.identity
+
+	# Set key to value. A key goes into the first empty
+	# child on its way down, and is only pushed further
+	# down when another key needs to pass its node, so
+	# each key costs about two nodes instead of one per
+	# level of the range.
+	def update(self, key, value):
+		if not self.lo <= key < self.hi:
+			raise KeyError(key)
+		node, start, end = 0, self.lo, self.hi
+		path = []
+		while True:
+			mid = (start + end) // 2
+			held = self.keys[node]
+			if held == key:
+				self.value[node] = value
+				break
+			if held is not None:
+				child = self._node(held, self.value[node])
+				if held < mid:
+					self.left[node] = child
+				else:
+					self.right[node] = child
+				self.keys[node] = None
+			path.append(node)
+			if key < mid:
+				if not self.left[node]:
+					self.left[node] = self._node(key, value)
+					break
+				node, end = self.left[node], mid
+			else:
+				if not self.right[node]:
+					self.right[node] = self._node(key, value)
+					break
+				node, start = self.right[node], mid
+		for node in reversed(path):
+			self.value[node] = self.combine(self._get(self.left[node]),
+				self._get(self.right[node]))
+
+	def query(self, l, r):
+		l, r = max(l, self.lo), min(r, self.hi)
+		nodes = []
+		if l >= r:
+			return self.identity
+		# left to right order is kept for combines that do
+		# not commute: the left child is popped first
+		stack = [(0, self.lo, self.hi)]
+		while stack:
+			node, start, end = stack.pop()
+			held = self.keys[node]
+			if held is not None:
+				if l <= held < r:
+					nodes.append(self.value[node])
+				continue
+			if end <= l or start >= r:
+				continue
+			if l <= start and end <= r:
+				nodes.append(self.value[node])
+				continue
+			mid = (start + end) // 2
+			if self.right[node]:
+				stack.append((self.right[node], mid, end))
+			if self.left[node]:
+				stack.append((self.left[node], start, mid))
+		result = self.identity
+		for value in nodes:
+			result = self.combine(result, value)
+		return result
+
+	# Bytes of the pool: two child arrays and the value
+	# and key slots, without the int objects themselves
+	def nbytes(self):
+		return self.left.itemsize * len(self.left) * 2 + 16 * len(self.value)
+
+
+class CompressedSegmentTree:
+	def __init__(self, keys, values=None, combine=max, identity=INT_MIN):
+		self.keys = sorted(set(keys))
+		self.positions = np.asarray(self.keys)
+		self.index = {key: i for i, key in enumerate(self.keys)}
+		self.identity = identity
+		if values is None:
+			values = [identity] * len(self.keys)
+		else:
+			# the last value given for a key wins
+			by_key = dict(zip(keys, values))
+			values = [by_key[key] for key in self.keys]
+		self.tree = SegmentTree(values, combine, identity)
+
+	def update(self, key, value):
+		self.tree.update(self.index[key], value)
+
+	# Combine of every known key in [l, r)
+	def query(self, l, r):
+		return self.tree.query(bisect_left(self.keys, l), bisect_left(self.keys, r))
+
+	def query_many(self, lefts, rights):
+		return self.tree.query_many(np.searchsorted(self.positions, lefts),
+			np.searchsorted(self.positions, rights))
+
+
+# Random updates and queries on a range of 1e18 against
+# a dict of the touched keys
+def check_dynamic_segment_tree(seed=0):
+	rng = random.Random(seed)
+	lo, hi = -10 ** 18, 10 ** 18
+	for combine, identity in ((max, INT_MIN), (lambda a, b: a + b, 0)):
+		dynamic = DynamicSegmentTree(lo, hi, combine, identity)
+		keys = [rng.randrange(lo, hi) for _ in range(200)]
+		compressed = CompressedSegmentTree(keys, None, combine, identity)
+		model = {}
+		for _ in range(1000):
+			key, value = rng.choice(keys), rng.randrange(-1000, 1000)
+			dynamic.update(key, value)
+			compressed.update(key, value)
+			model[key] = value
+			l = rng.choice(keys + [lo, rng.randrange(lo, hi)])
+			r = rng.choice(keys + [hi, rng.randrange(lo, hi)])
+			expected = identity
+			for key in sorted(model):
+				if l <= key < r:
+					expected = combine(expected, model[key])
+			assert dynamic.query(l, r) == expected
+			assert compressed.query(l, r) == expected
+	print("dynamic and compressed segment trees match the dict")
+
+
+# Max over time windows of nanosecond timestamps: the
+# dynamic tree against the compressed one
+def benchmark_dynamic_segment_tree(events=100000, queries=20000):
+	rng = random.Random(9)
+	stamps = [rng.randrange(2 ** 62) for _ in range(events)]
+	values = [rng.randrange(10 ** 6) for _ in range(events)]
+	windows = []
+	for _ in range(queries):
+		start = rng.randrange(2 ** 62)
+		windows.append((start, start + rng.randrange(2 ** 58)))
+
+	begin = time.perf_counter()
+	dynamic = DynamicSegmentTree(0, 2 ** 62)
+	for stamp, value in zip(stamps, values):
+		dynamic.update(stamp, value)
+	built = time.perf_counter() - begin
+	begin = time.perf_counter()
+	expected = [dynamic.query(l, r) for l, r in windows]
+	queried = time.perf_counter() - begin
+	print("dynamic:    %d nodes, %.0f bytes/key, build %.2fs, %d queries %.2fs" % (
+		len(dynamic), dynamic.nbytes() / events, built, queries, queried))
+
+	begin = time.perf_counter()
+	compressed = CompressedSegmentTree(stamps, values)
+	built = time.perf_counter() - begin
+	lefts, rights = zip(*windows)
+	begin = time.perf_counter()
+	got = compressed.query_many(lefts, rights)
+	queried = time.perf_counter() - begin
+	assert got.tolist() == expected
+	print("compressed: %d slots, build %.2fs, %d batched queries %.3fs" % (
+		2 * len(compressed.keys), built, queries, queried))
+
+
+# Driver Code
+if __name__ == "__main__":
+	# keys are timestamps far apart, no array of that size
+	# could be allocated
+	st = DynamicSegmentTree(0, 2 ** 63)
+	st.update(1700000000000000000, 5)
+	st.update(1700000000000000100, 9)
+	st.update(3, 4)
+	print(st.query(1000, 2 ** 63), st.query(0, 1700000000000000050), len(st))  # 9 5 60
+
+	ct = CompressedSegmentTree([3, 1700000000000000000, 1700000000000000100], [4, 5, 9])
+	print(ct.query(1000, 2 ** 63), ct.query(0, 1700000000000000050))  # 9 5
+
+	check_dynamic_segment_tree()
+	# the benchmarks take a while, so they only run
+	# when asked for: python segment_tree_dynamic.py --bench
+	if "--bench" in sys.argv:
+		benchmark_dynamic_segment_tree()
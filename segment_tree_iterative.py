@@ -14,7 +14,16 @@
 # log n time because there we have to update all the levels starting from the leaf node
 # where we update the exact value at the exact index given by the user.
 
+import math
+import operator
+import sys
+import time
+from array import array
+from functools import reduce
 from sys import maxsize
+
+import numpy as np
+
 INT_MIN = -maxsize
 
 def construct_segment_tree(a: list, n: int):
@@ -83,6 +92,311 @@ def range_query(left: int, right: int, n: int) -> int:
 		right //= 2
 	return ma
 
+# Answer many half open ranges over a tree array
+# laid out as above, every range moving up one level
+# per step. ufunc must commute, so that both ends can
+# fold into one result. Slot 0 is never used by the
+# tree, so it is set to fill, the identity, and every
+# range with nothing to add at a level reads it.
+def _query_levels(view, n, lefts, rights, ufunc, fill):
+	left = np.asarray(lefts, dtype=np.int64) + n
+	right = np.asarray(rights, dtype=np.int64) + n
+	result = np.full(len(left), fill, dtype=view.dtype)
+	view[0] = fill
+	while True:
+		live = left < right
+		if not live.any():
+			break
+		take = live & (left & 1).astype(bool)
+		result = ufunc(result, view[left * take])
+		left += take
+		take = live & (right & 1).astype(bool)
+		right -= take
+		result = ufunc(result, view[right * take])
+		left >>= 1
+		right >>= 1
+	return result
+
+# Maximum of every range [left[k], right[k]) at once,
+# from arrays of bounds, over the global segtree
+def range_query_many(left, right, n: int):
+	view = np.asarray(segtree)
+	return _query_levels(view, n, left, right, np.maximum, INT_MIN)
+
+
+
+# Built-in combine functions that have a numpy ufunc,
+# used to build and to answer batches level by level
+_UFUNCS = {
+	max: np.maximum,
+	min: np.minimum,
+	operator.add: np.add,
+	operator.mul: np.multiply,
+	math.gcd: np.gcd,
+	operator.or_: np.bitwise_or,
+	operator.and_: np.bitwise_and,
+	operator.xor: np.bitwise_xor,
+}
+
+# Combines whose result never leaves the range of its
+# arguments, so a tree of int64 leaves has int64 nodes.
+# Sums and products can grow past 64 bits, and keep
+# their ints in a list.
+_BOUNDED = {max, min, math.gcd, operator.or_, operator.and_, operator.xor}
+
+# Built-ins that can fold a whole list of numeric nodes
+# in one call, given the identity for an empty list
+_FOLDS = {
+	max: lambda nodes, identity: max(nodes) if nodes else identity,
+	min: lambda nodes, identity: min(nodes) if nodes else identity,
+	operator.add: lambda nodes, identity: sum(nodes, identity),
+	math.gcd: lambda nodes, identity: math.gcd(identity, *nodes),
+}
+
+
+# Typecode for an array that holds every value and
+# every node combine can make from them exactly, or
+# None when they have to stay in a list. Floats are
+# doubles either way; ints mixed with floats are not
+# turned into floats.
+def _typecode(values, combine):
+	if all(type(value) is int for value in values):
+		if combine not in _BOUNDED:
+			return None
+		try:
+			array('q', values)
+			return 'q'
+		except OverflowError:
+			return None
+	if all(type(value) is float for value in values):
+		return 'd'
+	return None
+
+
+# Whether an array of typecode holds every one of
+# values, a numpy array, without changing it
+def _holds(typecode, values):
+	if not len(values):
+		return True
+	kind = values.dtype.kind
+	if typecode in 'bBhHiIlLqQ':
+		info = np.iinfo(np.dtype(typecode))
+		return kind in 'biu' and info.min <= int(values.min()) and int(values.max()) <= info.max
+	if kind in 'biu':
+		return int(np.abs(values).max()) <= 2 ** 53
+	return kind == 'f'
+
+
+# Same layout as the functions above, for any
+# associative combine with an identity: leaves at
+# tree[n:2n], node i combines 2i and 2i+1, queries
+# are half open. Numbers are kept in an array with a
+# numpy view over the same memory; anything else,
+# such as (value, index) pairs for argmax, in a list.
+# Without a typecode the storage is picked from the
+# values, and moves to a list when an update brings a
+# value the array cannot hold; with one, such a value
+# raises TypeError.
+class SegmentTree:
+	def __init__(self, values, combine=max, identity=INT_MIN, typecode=None):
+		self.combine = combine
+		self.identity = identity
+		self.typecode = typecode
+		self.build(values)
+
+	def build(self, values):
+		values = list(values)
+		n = self.n = len(values)
+		typecode = self.typecode or _typecode(values, self.combine)
+		if typecode is None:
+			self.tree = [self.identity] * n + values
+			self.view = self.ufunc = self.fold = None
+		else:
+			self.tree = array(typecode, bytes(array(typecode).itemsize * n)) + \
+				array(typecode, values)
+			self.view = np.frombuffer(self.tree, dtype=typecode)
+			# leaf values that need no check on update
+			self.scalar = {'q': int, 'd': float}.get(typecode)
+			# numpy wraps ints around where Python raises, so
+			# an int array given for a sum combines in Python
+			if typecode == 'd' or self.combine in _BOUNDED:
+				self.ufunc = _UFUNCS.get(self.combine)
+			else:
+				self.ufunc = None
+			self.fold = _FOLDS.get(self.combine)
+
+		if self.ufunc is not None and n > 1:
+			# nodes [m, 2m) only have children in [2m, 4m),
+			# so each block is one vectorized step
+			m = 1 << ((n - 1).bit_length() - 1)
+			while m:
+				hi = min(2 * m, n)
+				self.view[m:hi] = self.ufunc(self.view[2 * m:2 * hi:2],
+					self.view[2 * m + 1:2 * hi:2])
+				m >>= 1
+		else:
+			tree, combine = self.tree, self.combine
+			for i in range(n - 1, 0, -1):
+				tree[i] = combine(tree[2 * i], tree[2 * i + 1])
+
+	# Make sure the storage holds values, a numpy array,
+	# moving it to a list if it cannot
+	def _admit(self, values):
+		if self.view is None or _holds(self.tree.typecode, values):
+			return
+		if self.typecode is not None:
+			raise TypeError("values do not fit typecode %r" % self.typecode)
+		self.tree = self.tree.tolist()
+		self.view = self.ufunc = self.fold = None
+
+	def update(self, pos, value):
+		if self.view is not None and not (type(value) is self.scalar and
+				(self.scalar is float or -maxsize - 1 <= value <= maxsize)):
+			# anything else goes through the same check as
+			# update_many
+			self._admit(np.asarray([value]))
+		tree, combine = self.tree, self.combine
+		pos += self.n
+		tree[pos] = value
+		while pos > 1:
+			pos //= 2
+			tree[pos] = combine(tree[2 * pos], tree[2 * pos + 1])
+
+	# Combine of values[left:right]. Nodes are collected
+	# in order, left ones forward and right ones
+	# backward, so the combine need not commute
+	def query(self, left, right):
+		tree = self.tree
+		left += self.n
+		right += self.n
+		nodes, tail = [], []
+		while left < right:
+			if left & 1:
+				nodes.append(tree[left])
+				left += 1
+			if right & 1:
+				right -= 1
+				tail.append(tree[right])
+			left //= 2
+			right //= 2
+		nodes.extend(reversed(tail))
+		if self.fold is not None:
+			return self.fold(nodes, self.identity)
+		return reduce(self.combine, nodes, self.identity)
+
+	# Set values[positions[k]] = values[k], the last
+	# one winning for repeated positions, then redo
+	# every touched ancestor once per level
+	def update_many(self, positions, values):
+		if self.view is not None:
+			self._admit(np.asarray(values))
+		if self.ufunc is None:
+			if isinstance(values, np.ndarray):
+				values = values.tolist()
+			tree, combine = self.tree, self.combine
+			touched = set()
+			for pos, value in zip(positions, values):
+				tree[pos + self.n] = value
+				touched.add((pos + self.n) // 2)
+			while touched:
+				for pos in sorted(touched, reverse=True):
+					tree[pos] = combine(tree[2 * pos], tree[2 * pos + 1])
+				touched = {pos // 2 for pos in touched if pos > 1}
+			return
+		positions = np.asarray(positions, dtype=np.int64)[::-1]
+		values = np.asarray(values)[::-1]
+		positions, last = np.unique(positions, return_index=True)
+		view = self.view
+		view[positions + self.n] = values[last]
+		pos = np.unique((positions + self.n) >> 1)
+		while len(pos):
+			view[pos] = self.ufunc(view[2 * pos], view[2 * pos + 1])
+			pos = np.unique(pos[pos > 1] >> 1)
+
+	# Answers for many half open ranges, every range
+	# moving up one level per step
+	def query_many(self, lefts, rights):
+		fill = None
+		if self.ufunc is not None:
+			try:
+				fill = self.view.dtype.type(self.identity)
+			except (OverflowError, ValueError):
+				pass
+		# an identity the array cannot hold, such as -inf
+		# for integers, leaves the one-at-a-time path, as
+		# does an empty tree, which has no slot 0 to fill
+		if fill is None or fill != self.identity or not self.n:
+			return [self.query(l, r) for l, r in zip(lefts, rights)]
+		return _query_levels(self.view, self.n, lefts, rights, self.ufunc, fill)
+
+
+# Range max over random ranges with point updates in
+# between: the functions above, the class one call at
+# a time, and the class in batches
+def benchmark_segment_tree(n=200000, ops=100000):
+	global segtree
+	rng = np.random.default_rng(4)
+	a = rng.integers(0, 10 ** 9, n).tolist()
+	positions = rng.integers(0, n, ops).tolist()
+	values = rng.integers(0, 10 ** 9, ops).tolist()
+	lefts = rng.integers(0, n, ops)
+	rights = np.minimum(n, lefts + rng.integers(1, n, ops)).tolist()
+	lefts = lefts.tolist()
+
+	start = time.perf_counter()
+	segtree = [0] * (2 * n)
+	construct_segment_tree(a, n)
+	for pos, value in zip(positions, values):
+		update(pos, value, n)
+	expected = [range_query(l, r, n) for l, r in zip(lefts, rights)]
+	functions = time.perf_counter() - start
+
+	start = time.perf_counter()
+	st = SegmentTree(a)
+	for pos, value in zip(positions, values):
+		st.update(pos, value)
+	single = [st.query(l, r) for l, r in zip(lefts, rights)]
+	one_by_one = time.perf_counter() - start
+
+	start = time.perf_counter()
+	st = SegmentTree(a)
+	st.update_many(positions, values)
+	batched = st.query_many(lefts, rights)
+	many = time.perf_counter() - start
+	assert single == expected and batched.tolist() == expected
+	print("build + %d updates + %d max queries: functions %.2fs, "
+		"SegmentTree %.2fs, batched %.3fs" % (ops, ops, functions, one_by_one, many))
+
+
+# Batches of range max queries: range_query per query
+# against range_query_many and SegmentTree.query_many
+def benchmark_range_query_many(n=1000000, queries=200000):
+	global segtree
+	rng = np.random.default_rng(6)
+	a = rng.integers(0, 10 ** 9, n).tolist()
+	segtree = [0] * (2 * n)
+	construct_segment_tree(a, n)
+	left = rng.integers(0, n, queries)
+	right = np.minimum(n, left + rng.integers(1, n, queries))
+
+	start = time.perf_counter()
+	expected = [range_query(l, r, n) for l, r in zip(left.tolist(), right.tolist())]
+	loop = time.perf_counter() - start
+	start = time.perf_counter()
+	got = range_query_many(left, right, n)
+	many = time.perf_counter() - start
+	assert got.tolist() == expected
+	# the class keeps its numpy view, so there is no
+	# list to convert first
+	st = SegmentTree(a)
+	start = time.perf_counter()
+	got = st.query_many(left, right)
+	typed = time.perf_counter() - start
+	assert got.tolist() == expected
+	print("%d range max queries on %d values: loop %.2fs, range_query_many %.3fs (%.0fx), "
+		"SegmentTree.query_many %.3fs (%.0fx)" % (
+		queries, n, loop, many, loop / many, typed, loop / typed))
+
 
 # Driver Code
 if __name__ == "__main__":
@@ -114,4 +428,17 @@ if __name__ == "__main__":
 	print("Maximum in range %d to %d is %d" %
 		(left, right, range_query(left, right + 1, n)))
 
+	# The same tree as a class, next to a sum tree and
+	# an argmax tree over (value, -index) pairs
+	st = SegmentTree([2, 6, 10, 4, 7, 32, 9, 11, 6, 33])
+	sums = SegmentTree(a, operator.add, 0)
+	argmax = SegmentTree([(v, -i) for i, v in enumerate(a)], max, (INT_MIN, 0))
+	print(st.query(2, 9), sums.query(2, 9), -argmax.query(0, 9)[1])  # 32 75 5
+	print(st.query_many([0, 6], [4, 10]))  # [10 33]
+	print(range_query_many(np.array([1, 2]), np.array([6, 9]), n))  # [32 32]
 
+	# the benchmarks take a while, so they only run
+	# when asked for: python segment_tree_iterative.py --bench
+	if "--bench" in sys.argv:
+		benchmark_segment_tree()
+		benchmark_range_query_many()
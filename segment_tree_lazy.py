@@ -0,0 +1,214 @@
+# Python Program to implement an iterative segment tree
+# with lazy propagation.
+# Range updates do not walk down to every leaf they cover. As in the
+# iterative segment tree, the range [l, r) is split into O(log n) nodes
+# by moving l and r up one level at a time, and each of those nodes takes
+# the update at once and keeps it as a pending tag for its children.
+# A tag is pushed one level down only when a later update or query needs
+# to look inside that node, which only happens on the paths above the two
+# ends of the range. So range_add, range_assign and the range sum, max and
+# min queries all take O(log n), without any recursion.
+#
+# The tree has size = a power of two >= n leaves so that every node at one
+# depth covers the same number of elements. Leaves past n hold the identity
+# of each aggregate and never receive a tag, because a tag only lands on a
+# node lying fully inside an updated range.
+
+import random
+import sys
+import time
+
+from segment_tree_iterative import SegmentTree
+
+
+class LazySegmentTree:
+	def __init__(self, values):
+		n = self.n = len(values)
+		self.log = max(n - 1, 0).bit_length()
+		size = self.size = 1 << self.log
+		self.sums = [0] * (2 * size)
+		self.maxs = [float('-inf')] * (2 * size)
+		self.mins = [float('inf')] * (2 * size)
+		# pending assignment (None if there is none) and
+		# pending add, assignment first
+		self.assigned = [None] * size
+		self.added = [0] * size
+		for i, value in enumerate(values):
+			self.sums[size + i] = self.maxs[size + i] = self.mins[size + i] = value
+		for k in range(size - 1, 0, -1):
+			self._pull(k)
+
+	def __len__(self):
+		return self.n
+
+	def _pull(self, k):
+		self.sums[k] = self.sums[2 * k] + self.sums[2 * k + 1]
+		self.maxs[k] = max(self.maxs[2 * k], self.maxs[2 * k + 1])
+		self.mins[k] = min(self.mins[2 * k], self.mins[2 * k + 1])
+
+	# Apply an assignment and/or add to node k, and keep
+	# it as a tag if k has children
+	def _apply(self, k, assign, add):
+		width = self.size >> (k.bit_length() - 1)
+		if assign is not None:
+			self.sums[k] = assign * width
+			self.maxs[k] = self.mins[k] = assign
+			if k < self.size:
+				self.assigned[k] = assign
+				self.added[k] = 0
+		if add:
+			self.sums[k] += add * width
+			self.maxs[k] += add
+			self.mins[k] += add
+			if k < self.size:
+				self.added[k] += add
+
+	def _push(self, k):
+		assign, add = self.assigned[k], self.added[k]
+		if assign is not None or add:
+			self._apply(2 * k, assign, add)
+			self._apply(2 * k + 1, assign, add)
+			self.assigned[k] = None
+			self.added[k] = 0
+
+	# Push the tags on the paths above both ends of
+	# [l, r), top down; l and r are leaf positions
+	def _push_ends(self, l, r):
+		for i in range(self.log, 0, -1):
+			if ((l >> i) << i) != l:
+				self._push(l >> i)
+			if ((r >> i) << i) != r:
+				self._push((r - 1) >> i)
+
+	def _update(self, l, r, assign, add):
+		if l >= r:
+			return
+		l += self.size
+		r += self.size
+		self._push_ends(l, r)
+		lo, hi = l, r
+		while lo < hi:
+			if lo & 1:
+				self._apply(lo, assign, add)
+				lo += 1
+			if hi & 1:
+				hi -= 1
+				self._apply(hi, assign, add)
+			lo >>= 1
+			hi >>= 1
+		# redo the nodes above both ends, bottom up
+		for i in range(1, self.log + 1):
+			if ((l >> i) << i) != l:
+				self._pull(l >> i)
+			if ((r >> i) << i) != r:
+				self._pull((r - 1) >> i)
+
+	# Add delta to every value in [l, r)
+	def range_add(self, l, r, delta):
+		self._update(l, r, None, delta)
+
+	# Set every value in [l, r) to value
+	def range_assign(self, l, r, value):
+		self._update(l, r, value, 0)
+
+	# The nodes from one aggregate that together cover
+	# exactly [l, r)
+	def _collect(self, l, r, tree):
+		nodes = []
+		if l >= r:
+			return nodes
+		l += self.size
+		r += self.size
+		self._push_ends(l, r)
+		while l < r:
+			if l & 1:
+				nodes.append(tree[l])
+				l += 1
+			if r & 1:
+				r -= 1
+				nodes.append(tree[r])
+			l >>= 1
+			r >>= 1
+		return nodes
+
+	def range_sum(self, l, r):
+		return sum(self._collect(l, r, self.sums))
+
+	def range_max(self, l, r):
+		return max(self._collect(l, r, self.maxs), default=float('-inf'))
+
+	def range_min(self, l, r):
+		return min(self._collect(l, r, self.mins), default=float('inf'))
+
+
+# Random range adds and assignments against a plain
+# list, checking all three queries after each one
+def check_lazy_segment_tree(n=200, rounds=3000, seed=0):
+	rng = random.Random(seed)
+	model = [rng.randrange(-100, 100) for _ in range(n)]
+	st = LazySegmentTree(model)
+	for _ in range(rounds):
+		l = rng.randrange(n)
+		r = rng.randrange(l, n + 1)
+		if rng.random() < 0.5:
+			delta = rng.randrange(-20, 20)
+			st.range_add(l, r, delta)
+			model[l:r] = [value + delta for value in model[l:r]]
+		else:
+			value = rng.randrange(-100, 100)
+			st.range_assign(l, r, value)
+			model[l:r] = [value] * (r - l)
+		l = rng.randrange(n)
+		r = rng.randrange(l + 1, n + 1)
+		assert st.range_sum(l, r) == sum(model[l:r])
+		assert st.range_max(l, r) == max(model[l:r])
+		assert st.range_min(l, r) == min(model[l:r])
+	print("lazy segment tree matches the plain list")
+
+
+# Range adds over wide intervals followed by a max
+# query: point updates on SegmentTree against one
+# lazy range_add
+def benchmark_lazy_segment_tree(n=50000, ops=20):
+	rng = random.Random(5)
+	a = [rng.randrange(10 ** 6) for _ in range(n)]
+	ranges = []
+	for _ in range(ops):
+		l = rng.randrange(n)
+		ranges.append((l, rng.randrange(l + 1, n + 1), rng.randrange(-100, 100)))
+
+	start = time.perf_counter()
+	st = SegmentTree(a)
+	for l, r, delta in ranges:
+		for i in range(l, r):
+			st.update(i, st.tree[st.n + i] + delta)
+	expected = [st.query(l, r) for l, r, _ in ranges]
+	points = time.perf_counter() - start
+
+	start = time.perf_counter()
+	lazy = LazySegmentTree(a)
+	for l, r, delta in ranges:
+		lazy.range_add(l, r, delta)
+	got = [lazy.range_max(l, r) for l, r, _ in ranges]
+	lazy_time = time.perf_counter() - start
+	assert got == expected
+	print("%d range adds on %d values: point updates %.2fs, lazy %.3fs" % (
+		ops, n, points, lazy_time))
+
+
+# Driver Code
+if __name__ == "__main__":
+	a = [2, 6, 10, 4, 7, 28, 9, 11, 6, 33]
+	st = LazySegmentTree(a)
+
+	# add 5 to indices 2 to 6, then set 4 to 8 to 1
+	st.range_add(2, 7, 5)
+	st.range_assign(4, 9, 1)
+	# contents are now {2, 6, 15, 9, 1, 1, 1, 1, 1, 33}
+	print(st.range_sum(0, 10), st.range_max(0, 5), st.range_min(2, 4))  # 70 15 9
+
+	check_lazy_segment_tree()
+	# the benchmarks take a while, so they only run
+	# when asked for: python segment_tree_lazy.py --bench
+	if "--bench" in sys.argv:
+		benchmark_lazy_segment_tree()
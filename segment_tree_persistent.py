@@ -0,0 +1,203 @@
+""" Python implementation of a persistent segment tree.
+It answers the same range maximum queries as the tree in
+segmenttree_recursive.py, but every update makes a new
+version and all earlier versions stay queryable.
+
+An update only changes the nodes on the path from the root
+to one leaf. Instead of overwriting them, it makes new
+copies of just those O(log n) nodes, and each copy points to
+the untouched child of the old node. The new root is the
+entry point to the new version, and the old root still sees
+the tree as it was. So versions share every subtree that
+an update did not pass through.
+
+Nodes are not Python objects. They are rows in a pool of
+three arrays, left child, right child and value, so one
+node costs 16 bytes and a version costs about
+16 * (log2 n + 1) bytes. Values go in an int64 or a
+double array while they all fit one; the first value
+that does not, such as a float among ints or an int
+of 64 bits or more, moves them to a plain list.
+"""
+
+import random
+import sys
+import time
+from array import array
+
+
+# Whether an array of typecode holds value exactly
+def _fits(typecode, value):
+    if typecode == 'd':
+        return type(value) is float
+    return type(value) is int and -2 ** 63 <= value < 2 ** 63
+
+
+class PersistentSegmentTree:
+    def __init__(self, arr):
+        self.n = len(arr)
+        self.left = array('i')
+        self.right = array('i')
+        if all(type(value) is float for value in arr):
+            self.value = array('d')
+        else:
+            self.value = array('q')
+        self.roots = [self._build(arr, 0, self.n - 1)]
+        self.base_bytes = self.nbytes()
+
+    # The value is placed first, so a value the pool
+    # cannot take never leaves the three arrays out of
+    # step
+    def _node(self, value, left, right):
+        if type(self.value) is array and not _fits(self.value.typecode, value):
+            self.value = self.value.tolist()
+        self.value.append(value)
+        self.left.append(left)
+        self.right.append(right)
+        return len(self.value) - 1
+
+    # Build the first version, splitting ranges like
+    # build_segment_tree
+    def _build(self, arr, start, end):
+        if start == end:
+            return self._node(arr[start], -1, -1)
+        mid = (start + end) // 2
+        left = self._build(arr, start, mid)
+        right = self._build(arr, mid + 1, end)
+        return self._node(max(self.value[left], self.value[right]), left, right)
+
+    def __len__(self):
+        return len(self.roots)
+
+    # Set index to value on top of version (the latest
+    # one by default) and return the new version number
+    def update(self, index, value, version=-1):
+        node = self.roots[version]
+        start, end = 0, self.n - 1
+        path = []
+        while start != end:
+            mid = (start + end) // 2
+            went_left = index <= mid
+            path.append((node, went_left))
+            if went_left:
+                node, end = self.left[node], mid
+            else:
+                node, start = self.right[node], mid + 1
+
+        # copy the path bottom up, each copy keeping the
+        # other child of the node it replaces
+        new = self._node(value, -1, -1)
+        for node, went_left in reversed(path):
+            if went_left:
+                left, right = new, self.right[node]
+            else:
+                left, right = self.left[node], new
+            new = self._node(max(self.value[left], self.value[right]), left, right)
+        self.roots.append(new)
+        return len(self.roots) - 1
+
+    # Maximum over [l, r] as of version
+    def query(self, version, l, r):
+        best = float('-inf')
+        stack = [(self.roots[version], 0, self.n - 1)]
+        while stack:
+            node, start, end = stack.pop()
+            if l > end or r < start:
+                continue
+            if l <= start and r >= end:
+                if self.value[node] > best:
+                    best = self.value[node]
+                continue
+            mid = (start + end) // 2
+            stack.append((self.left[node], start, mid))
+            stack.append((self.right[node], mid + 1, end))
+        return best
+
+    # Bytes of the pool; a list of values counts its
+    # slots, without the number objects themselves
+    def nbytes(self):
+        itemsize = self.value.itemsize if type(self.value) is array else 8
+        return (self.left.itemsize + self.right.itemsize + itemsize) * len(self.value)
+
+    # Bytes added per version on top of the first one
+    def bytes_per_version(self):
+        if len(self.roots) == 1:
+            return 0
+        return (self.nbytes() - self.base_bytes) / (len(self.roots) - 1)
+
+
+# Random updates against a list of full copies, with
+# queries on random past versions
+def check_persistent_segment_tree(seed=0):
+    rng = random.Random(seed)
+    for n in list(range(1, 20)) + [257]:
+        copies = [[rng.randrange(-100, 100) for _ in range(n)]]
+        pst = PersistentSegmentTree(copies[0])
+        for _ in range(100):
+            version = rng.randrange(len(copies))
+            index, value = rng.randrange(n), rng.randrange(-100, 100)
+            copy = copies[version][:]
+            copy[index] = value
+            copies.append(copy)
+            assert pst.update(index, value, version) == len(copies) - 1
+            version = rng.randrange(len(copies))
+            l = rng.randrange(n)
+            r = rng.randrange(l, n)
+            assert pst.query(version, l, r) == max(copies[version][l:r + 1])
+    # a float on an int tree and an int past 64 bits move
+    # the values to a list, without disturbing the nodes
+    copies = [[1, 2, 3, 4]]
+    pst = PersistentSegmentTree(copies[0])
+    for index, value in ((0, 2.5), (1, 2 ** 70), (3, -2 ** 64), (2, 7)):
+        copy = copies[-1][:]
+        copy[index] = value
+        copies.append(copy)
+        pst.update(index, value)
+    for version, copy in enumerate(copies):
+        for i in range(4):
+            assert pst.query(version, i, i) == copy[i]
+        assert pst.query(version, 0, 3) == max(copy)
+    assert PersistentSegmentTree([2 ** 63, 1.5, 3]).query(0, 0, 2) == 2 ** 63
+    print("persistent segment tree matches the copied versions")
+
+
+# Memory per version against copying the whole tree
+# list on every update, and queries on old versions
+def benchmark_persistent_segment_tree(n=100000, updates=20000, queries=20000):
+    rng = random.Random(8)
+    arr = [rng.randrange(10 ** 9) for _ in range(n)]
+    start = time.perf_counter()
+    pst = PersistentSegmentTree(arr)
+    for _ in range(updates):
+        pst.update(rng.randrange(n), rng.randrange(10 ** 9))
+    update_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(queries):
+        l = rng.randrange(n)
+        pst.query(rng.randrange(len(pst)), l, rng.randrange(l, n))
+    query_time = time.perf_counter() - start
+    # a copied version holds its own list of 4n slots,
+    # even though the ints themselves are shared
+    copy_bytes = sys.getsizeof([0] * (4 * n))
+    print("%d versions of %d values: %.0f bytes/version (a full copy is %d), "
+          "build + updates %.2fs, %d queries %.2fs" % (
+              len(pst), n, pst.bytes_per_version(), copy_bytes,
+              update_time, queries, query_time))
+
+
+if __name__ == "__main__":
+    arr = [1, 3, 2, 4, 6, 8]
+    pst = PersistentSegmentTree(arr)
+
+    # version 1 sets index 2 to 7, version 2 sets index 0
+    # to 9 on top of it
+    pst.update(2, 7)
+    pst.update(0, 9)
+    print(pst.query(0, 0, 3), pst.query(1, 0, 3), pst.query(2, 0, 3))  # 4 7 9
+
+    check_persistent_segment_tree()
+    # the benchmarks take a while, so they only run
+    # when asked for: python segment_tree_persistent.py --bench
+    if "--bench" in sys.argv:
+        benchmark_persistent_segment_tree()
@@ -36,6 +36,11 @@ updates a specific element. The findmaximum function is used
 to find the maximum in a given range.
 """
 
+import sys
+import time
+
+import numpy as np
+
 
 # Function to build the segment tree
 def build_segment_tree(arr, tree, node, start, end):
@@ -82,19 +87,172 @@ def find_maximum(tree, node, start, end, l, r):
     # Return the maximum of left and right subtree
     return max(left_max, right_max)
 
-# Example usage
-arr = [1, 3, 2, 4, 6, 8]
-n = len(arr)
+# Interval segment tree for stabbing queries: which of a set of
+# closed intervals [lo, hi] contain a point. The endpoints are
+# compressed into 2m - 1 elementary slots, slot 2i for the
+# endpoint xs[i] itself and slot 2i + 1 for the open gap after
+# it, so any point falls in exactly one slot. Every interval is
+# stored at the O(log m) nodes that exactly cover its slots, and
+# the intervals that contain a point are those stored on the
+# path from its slot up to the root, found in O(log m + k).
+# Node lists are kept as one array of interval ids sorted by
+# node, with offsets per node.
+class IntervalSegmentTree:
+    def __init__(self, intervals, ids=None):
+        intervals = np.asarray(intervals).reshape(-1, 2)
+        ids = np.arange(len(intervals)) if ids is None else np.asarray(ids)
+        self.xs = np.unique(intervals)
+        self.size = max(2 * len(self.xs) - 1, 1)
+
+        # decompose every interval at once, one tree level
+        # per step, like the iterative segment tree queries
+        left = 2 * np.searchsorted(self.xs, intervals[:, 0]) + self.size
+        right = 2 * np.searchsorted(self.xs, intervals[:, 1]) + 1 + self.size
+        owner = ids
+        nodes, stored = [], []
+        while len(left):
+            take = (left & 1) == 1
+            nodes.append(left[take])
+            stored.append(owner[take])
+            left = left + take
+            take = (right & 1) == 1
+            right = right - take
+            nodes.append(right[take])
+            stored.append(owner[take])
+            left >>= 1
+            right >>= 1
+            live = left < right
+            left, right, owner = left[live], right[live], owner[live]
+        nodes = np.concatenate(nodes) if nodes else np.zeros(0, dtype=np.int64)
+        stored = np.concatenate(stored) if stored else ids[:0]
+        order = np.argsort(nodes, kind='stable')
+        self.ids = stored[order]
+        self.offsets = np.searchsorted(nodes[order], np.arange(2 * self.size + 1))
+
+    # Slot of every point, and whether it lies inside
+    # the endpoints at all
+    def _slots(self, points):
+        points = np.asarray(points)
+        m = len(self.xs)
+        i = np.searchsorted(self.xs, points)
+        exact = (i < m) & (self.xs[np.minimum(i, max(m - 1, 0))] == points) if m else i < 0
+        inside = exact | ((i > 0) & (i < m))
+        return np.where(exact, 2 * i, 2 * i - 1), inside
+
+    # Ids of the intervals containing point
+    def stab(self, point):
+        slot, inside = self._slots([point])
+        if not inside[0]:
+            return []
+        node = int(slot[0]) + self.size
+        found = []
+        while node:
+            found.extend(self.ids[self.offsets[node]:self.offsets[node + 1]].tolist())
+            node >>= 1
+        return found
+
+    # stab for a whole array of points, as one array of
+    # ids per point, all paths walked one level per step
+    def stab_many(self, points):
+        slots, inside = self._slots(points)
+        which = np.flatnonzero(inside)
+        node = slots[inside] + self.size
+        owners, starts, counts = [], [], []
+        while len(node):
+            count = self.offsets[node + 1] - self.offsets[node]
+            has = count > 0
+            owners.append(which[has])
+            starts.append(self.offsets[node[has]])
+            counts.append(count[has])
+            node >>= 1
+            alive = node > 0
+            which, node = which[alive], node[alive]
+        if not owners:
+            return [self.ids[:0] for _ in range(len(inside))]
+        owners = np.concatenate(owners)
+        starts = np.concatenate(starts)
+        counts = np.concatenate(counts)
+        # expand every (start, count) run into positions in
+        # self.ids, then group them by point
+        total = counts.sum()
+        run = np.repeat(np.arange(len(counts)), counts)
+        positions = starts[run] + np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        owner = owners[run]
+        order = np.argsort(owner, kind='stable')
+        bounds = np.searchsorted(owner[order], np.arange(1, len(inside)))
+        return np.split(self.ids[positions[order]], bounds)
+
+
+# Random intervals and points, including endpoints
+# themselves, against a linear filter
+def check_interval_segment_tree(seed=0):
+    rng = np.random.default_rng(seed)
+    for n in (0, 1, 2, 5, 50, 500):
+        lo = rng.integers(0, 100, n)
+        intervals = np.stack([lo, lo + rng.integers(0, 20, n)], axis=1)
+        tree = IntervalSegmentTree(intervals)
+        points = np.concatenate([rng.integers(-5, 125, 200), intervals.ravel()]) + \
+            rng.choice([0, 0.5], 200 + 2 * n)
+        many = tree.stab_many(points)
+        for point, found in zip(points.tolist(), many):
+            expected = np.flatnonzero((intervals[:, 0] <= point) & (point <= intervals[:, 1]))
+            assert sorted(found.tolist()) == expected.tolist()
+            assert sorted(tree.stab(point)) == expected.tolist()
+    print("interval segment tree matches the linear filter")
+
+
+# Events stabbing active time windows: filtering every
+# window per event against stab and stab_many
+def benchmark_interval_segment_tree(n=100000, events=20000):
+    rng = np.random.default_rng(10)
+    lo = rng.integers(0, 10 ** 9, n)
+    intervals = np.stack([lo, lo + rng.integers(0, 10 ** 5, n)], axis=1)
+    points = rng.integers(0, 10 ** 9, events)
+
+    start = time.perf_counter()
+    tree = IntervalSegmentTree(intervals)
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    expected = [np.flatnonzero((intervals[:, 0] <= p) & (p <= intervals[:, 1]))
+                for p in points[:2000].tolist()]
+    linear = (time.perf_counter() - start) * events / 2000
+    start = time.perf_counter()
+    single = [tree.stab(p) for p in points.tolist()]
+    stabbed = time.perf_counter() - start
+    start = time.perf_counter()
+    many = tree.stab_many(points)
+    batched = time.perf_counter() - start
+    for a, b, c in zip(expected, single, many):
+        assert a.tolist() == sorted(b) == sorted(c.tolist())
+    print("%d intervals, %d points: build %.2fs, linear filter ~%.1fs, "
+          "stab %.2fs, stab_many %.3fs" % (n, events, built, linear, stabbed, batched))
+
+
+if __name__ == "__main__":
+    # Example usage
+    arr = [1, 3, 2, 4, 6, 8]
+    n = len(arr)
+
+    # Build the segment tree
+    tree = [0] * (4*n)
+    build_segment_tree(arr, tree, 0, 0, n - 1)
+
+    # Find maximum in range [0, 3] before update
+    print(find_maximum(tree, 0, 0, n - 1, 0, 3))  # Output: 4
 
-# Build the segment tree
-tree = [0] * (4*n)
-build_segment_tree(arr, tree, 0, 0, n - 1)
+    # Update value at index 2 to 7
+    update_element(arr, tree, 0, 0, n - 1, 2, 7)
 
-# Find maximum in range [0, 3] before update
-print(find_maximum(tree, 0, 0, n - 1, 0, 3))  # Output: 4
+    # Find maximum in range [0, 3] after update
+    print(find_maximum(tree, 0, 0, n - 1, 0, 3))  # Output: 7
 
-# Update value at index 2 to 7
-update_element(arr, tree, 0, 0, n - 1, 2, 7)
+    # Which windows contain a point, ids being the
+    # positions in the list
+    windows = IntervalSegmentTree([(1, 5), (3, 9), (10, 12), (4, 4)])
+    print(sorted(windows.stab(4)), sorted(windows.stab(9.5)))  # [0, 1, 3] []
 
-# Find maximum in range [0, 3] after update
-print(find_maximum(tree, 0, 0, n - 1, 0, 3))  # Output: 7
+    check_interval_segment_tree()
+    # the benchmarks take a while, so they only run
+    # when asked for: python segmenttree_recursive.py --bench
+    if "--bench" in sys.argv:
+        benchmark_interval_segment_tree()
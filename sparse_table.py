@@ -0,0 +1,209 @@
+# Python Program to implement a sparse table for range minimum
+# and maximum queries over an array that does not change.
+# Level k of the table holds the answer for every window of 2^k
+# elements, and is built from level k - 1 with one vectorized step:
+# the window at i is the combination of the windows at i and i + 2^(k-1).
+# A range [l, r) of length m is then covered by the two windows of
+# size 2^k, k = floor(log2 m), starting at l and ending at r. They may
+# overlap, which does not matter for min and max, so every query takes
+# two lookups no matter how long the range is.
+#
+# The table takes n log n entries. BlockSparseTable cuts that to O(n)
+# by building the table over blocks of the array only, and keeping the
+# prefix and suffix answers inside every block for the two partial
+# blocks at the ends of a range.
+#
+# Ranges are half open, as in segment_tree_iterative.py, and must not
+# be empty.
+
+import sys
+import time
+from sys import maxsize
+
+import numpy as np
+
+from segment_tree_iterative import SegmentTree
+
+_UFUNCS = {max: np.maximum, min: np.minimum}
+
+
+class SparseTable:
+	def __init__(self, values, op=max):
+		self.ufunc = _UFUNCS[op]
+		level = np.asarray(values)
+		self.n = len(level)
+		self.levels = [level]
+		width = 1
+		while 2 * width <= self.n:
+			level = self.ufunc(level[:-width], level[width:])
+			self.levels.append(level)
+			width *= 2
+
+	def nbytes(self):
+		return sum(level.nbytes for level in self.levels)
+
+	def query(self, l, r):
+		if l >= r:
+			raise ValueError("empty range")
+		k = (r - l).bit_length() - 1
+		level = self.levels[k]
+		return self.ufunc(level[l], level[r - (1 << k)])
+
+	def query_many(self, lefts, rights):
+		lefts = np.asarray(lefts, dtype=np.int64)
+		rights = np.asarray(rights, dtype=np.int64)
+		if (lefts >= rights).any():
+			raise ValueError("empty range")
+		# floor(log2(length)), exact for lengths below 2^53
+		k = np.frexp((rights - lefts).astype(np.float64))[1] - 1
+		result = np.empty(len(lefts), dtype=self.levels[0].dtype)
+		# one gather per level present in the batch
+		for level in np.unique(k):
+			pick = k == level
+			table = self.levels[level]
+			result[pick] = self.ufunc(table[lefts[pick]],
+				table[rights[pick] - (1 << int(level))])
+		return result
+
+
+class BlockSparseTable:
+	def __init__(self, values, op=max, block=16):
+		self.ufunc = _UFUNCS[op]
+		self.values = np.asarray(values)
+		self.n = len(self.values)
+		self.block = block
+		blocks = -(-self.n // block)
+		# pad the last block with a copy of the last value,
+		# which cannot change a min or a max
+		padded = np.empty(blocks * block, dtype=self.values.dtype)
+		padded[:self.n] = self.values
+		padded[self.n:] = self.values[-1] if self.n else 0
+		grid = padded.reshape(blocks, block)
+		self.prefix = self.ufunc.accumulate(grid, axis=1).ravel()
+		self.suffix = self.ufunc.accumulate(grid[:, ::-1], axis=1)[:, ::-1].ravel()
+		self.table = SparseTable(self.prefix[block - 1::block], op)
+
+	def nbytes(self):
+		return self.values.nbytes + self.prefix.nbytes + self.suffix.nbytes + \
+			self.table.nbytes()
+
+	def query(self, l, r):
+		if l >= r:
+			raise ValueError("empty range")
+		first, last = l // self.block, (r - 1) // self.block
+		if first == last:
+			return self.ufunc.reduce(self.values[l:r])
+		result = self.ufunc(self.suffix[l], self.prefix[r - 1])
+		if first + 1 < last:
+			result = self.ufunc(result, self.table.query(first + 1, last))
+		return result
+
+	def query_many(self, lefts, rights):
+		lefts = np.asarray(lefts, dtype=np.int64)
+		rights = np.asarray(rights, dtype=np.int64)
+		if (lefts >= rights).any():
+			raise ValueError("empty range")
+		first, last = lefts // self.block, (rights - 1) // self.block
+		result = np.empty(len(lefts), dtype=self.values.dtype)
+
+		# ranges inside one block are scanned, one offset
+		# of the block per step
+		inside = first == last
+		l, r = lefts[inside], rights[inside]
+		scan = self.values[l]
+		for offset in range(1, self.block):
+			more = l + offset < r
+			scan = self.ufunc(scan, self.values[np.where(more, l + offset, l)])
+		result[inside] = scan
+
+		l, r = lefts[~inside], rights[~inside]
+		first, last = first[~inside], last[~inside]
+		ends = self.ufunc(self.suffix[l], self.prefix[r - 1])
+		middle = first + 1 < last
+		ends[middle] = self.ufunc(ends[middle],
+			self.table.query_many(first[middle] + 1, last[middle]))
+		result[~inside] = ends
+		return result
+
+
+# Range min or max over values behind one interface,
+# query(l, r) and query_many(lefts, rights): a sparse
+# table when the values never change, the block
+# variant when the full table would pass
+# max_table_bytes, and a SegmentTree, which also has
+# update and update_many, when updates are expected.
+def range_query_engine(values, op=max, updates=False, max_table_bytes=1 << 28):
+	values = np.asarray(values)
+	if updates:
+		if values.dtype.kind in 'iu':
+			identity = -maxsize if op is max else maxsize
+		else:
+			identity = float('-inf') if op is max else float('inf')
+		return SegmentTree(values.tolist(), op, identity)
+	levels = max(len(values), 1).bit_length()
+	if len(values) * levels * values.itemsize > max_table_bytes:
+		return BlockSparseTable(values, op)
+	return SparseTable(values, op)
+
+
+# Check both tables against numpy on random ranges
+def check_sparse_table(seed=0):
+	rng = np.random.default_rng(seed)
+	for n in list(range(1, 40)) + [1000, 4099]:
+		values = rng.integers(-1000, 1000, n)
+		lefts = rng.integers(0, n, 300)
+		rights = lefts + 1 + (rng.integers(0, n, 300) % (n - lefts))
+		for op, reduce in ((max, np.max), (min, np.min)):
+			expected = [reduce(values[l:r]) for l, r in zip(lefts, rights)]
+			for table in (SparseTable(values, op), BlockSparseTable(values, op, block=4),
+					BlockSparseTable(values, op)):
+				assert table.query_many(lefts, rights).tolist() == expected
+				assert [table.query(l, r) for l, r in zip(lefts.tolist(), rights.tolist())] \
+					== expected
+	print("sparse tables match numpy")
+
+
+# Build time, memory and 200k range max queries for
+# the tables and the segment tree
+def benchmark_sparse_table(n=1000000, queries=200000):
+	rng = np.random.default_rng(7)
+	values = rng.integers(0, 10 ** 9, n)
+	lefts = rng.integers(0, n, queries)
+	rights = np.minimum(n, lefts + rng.integers(1, n, queries))
+
+	results = []
+	for name, build in (("SegmentTree", lambda: SegmentTree(values.tolist())),
+			("SparseTable", lambda: SparseTable(values)),
+			("BlockSparseTable", lambda: BlockSparseTable(values))):
+		start = time.perf_counter()
+		engine = build()
+		built = time.perf_counter() - start
+		start = time.perf_counter()
+		for l, r in zip(lefts[:10000].tolist(), rights[:10000].tolist()):
+			engine.query(l, r)
+		single = time.perf_counter() - start
+		start = time.perf_counter()
+		results.append(engine.query_many(lefts, rights).tolist())
+		many = time.perf_counter() - start
+		size = engine.view.nbytes if name == "SegmentTree" else engine.nbytes()
+		print("%-16s build %.3fs, %5.1f bytes/value, 10000 queries %.3fs, "
+			"%d batched %.3fs" % (name, built, size / n, single, queries, many))
+	assert results[0] == results[1] == results[2]
+
+
+# Driver Code
+if __name__ == "__main__":
+	a = [2, 6, 10, 4, 7, 28, 9, 11, 6, 33]
+	st = SparseTable(a)
+	print(st.query(1, 6), st.query(6, 9))  # 28 11
+	print(BlockSparseTable(a, min, block=4).query_many([0, 3], [10, 5]))  # [2 4]
+
+	# read only data gets a table, data that changes a tree
+	print(type(range_query_engine(a)).__name__)  # SparseTable
+	print(type(range_query_engine(a, updates=True)).__name__)  # SegmentTree
+
+	check_sparse_table()
+	# the benchmarks take a while, so they only run
+	# when asked for: python sparse_table.py --bench
+	if "--bench" in sys.argv:
+		benchmark_sparse_table()
@@ -14,8 +14,15 @@
 # basic operations such as inserion,search and deletion
 # on O(log n) amortized time.
 
+import itertools
+import random
+import sys
+import time
+
 
 class Node:
+    __slots__ = ('key', 'left', 'right')
+
     def __init__(self, key):
         self.key = key
         self.left = None
@@ -24,20 +31,27 @@ class Node:
 class SplayTree:
     def __init__(self):
         self.root = None
+        self.header = Node(None)
 
+    # Splay key's neighbourhood to the root, then put the
+    # new node above it, the root going to one side and
+    # the subtree on the far side of the key to the other
     def insert(self, key):
-        self.root = self._insert(self.root, key)
-
-    def _insert(self, node, key):
-        if node is None:
-            return Node(key)
-
-        if key < node.key:
-            node.left = self._insert(node.left, key)
-        elif key > node.key:
-            node.right = self._insert(node.right, key)
-
-        return self._splay(node, key)
+        if self.root is None:
+            self.root = Node(key)
+            return
+        root = self._splay(self.root, key)
+        if root.key == key:
+            self.root = root
+            return
+        node = Node(key)
+        if key < root.key:
+            node.left, node.right = root.left, root
+            root.left = None
+        else:
+            node.left, node.right = root, root.right
+            root.right = None
+        self.root = node
 
     def search(self, key):
         self.root = self._splay(self.root, key)
@@ -45,61 +59,97 @@ class SplayTree:
             return True
         return False
 
+    # Top-down splay in one pass: walking down from the
+    # root, nodes are split off into a left tree of
+    # smaller keys and a right tree of larger ones, with
+    # a rotation first when two steps go the same way.
+    # The last node reached is the new root, with the two
+    # trees as its children. No recursion, so a tree
+    # that has become a long path is no problem.
     def _splay(self, node, key):
-        if node is None or node.key == key:
-            return node
-
-        if key < node.key:
-            if node.left is None:
-                return node
-            if key < node.left.key:
-                node.left.left = self._splay(node.left.left, key)
-                node = self._rotate_right(node)
-            elif key > node.left.key:
-                node.left.right = self._splay(node.left.right, key)
-                if node.left.right is not None:
-                    node.left = self._rotate_left(node.left)
-
-            if node.left is not None:
-                return self._rotate_right(node)
-            else:
-                return node
-
-        else:
-            if node.right is None:
-                return node
-            if key < node.right.key:
-                node.right.left = self._splay(node.right.left, key)
-                if node.right.left is not None:
-                    node.right = self._rotate_right(node.right)
-            elif key > node.right.key:
-                node.right.right = self._splay(node.right.right, key)
-                node = self._rotate_left(node)
-
-            if node.right is not None:
-                return self._rotate_left(node)
+        if node is None:
+            return None
+        header = self.header
+        header.left = header.right = None
+        # left collects the keys below key, right those
+        # above, linked in at their max and min ends
+        left = right = header
+        while True:
+            if key < node.key:
+                child = node.left
+                if child is None:
+                    break
+                if key < child.key:
+                    # zig-zig: rotate right first
+                    node.left = child.right
+                    child.right = node
+                    node = child
+                    if node.left is None:
+                        break
+                right.left = node
+                right = node
+                node = node.left
+            elif key > node.key:
+                child = node.right
+                if child is None:
+                    break
+                if key > child.key:
+                    # zag-zag: rotate left first
+                    node.right = child.left
+                    child.left = node
+                    node = child
+                    if node.right is None:
+                        break
+                left.right = node
+                left = node
+                node = node.right
             else:
-                return node
-
-    def _rotate_right(self, node):
-        temp = node.left
-        node.left = temp.right
-        temp.right = node
-        return temp
-
-    def _rotate_left(self, node):
-        temp = node.right
-        node.right = temp.left
-        temp.left = node
-        return temp
-
-
-# Example usage:
-tree = SplayTree()
-tree.insert(10)
-tree.insert(5)
-tree.insert(20)
-tree.insert(3)
-
-print(tree.search(20))  # Output: True
-print(tree.search(15))  # Output: False
+                break
+        left.right = node.left
+        right.left = node.right
+        node.left = header.right
+        node.right = header.left
+        return node
+
+
+# Sequential inserts, which leave the tree a path,
+# then searches that are sequential, uniformly random
+# and Zipf-skewed, where a few keys take most accesses
+def benchmark_splay(n=100000, accesses=200000):
+    rng = random.Random(11)
+    start = time.perf_counter()
+    tree = SplayTree()
+    for key in range(n):
+        tree.insert(key)
+    print("%-10s %d inserts %.2fs" % ("sequential", n, time.perf_counter() - start))
+
+    weights = list(itertools.accumulate(1 / (rank + 1) ** 1.1 for rank in range(n)))
+    hot = list(range(n))
+    rng.shuffle(hot)
+    patterns = [("sequential", [i % n for i in range(accesses)]),
+                ("random", [rng.randrange(n) for _ in range(accesses)]),
+                ("zipf", rng.choices(hot, cum_weights=weights, k=accesses))]
+    for name, keys in patterns:
+        start = time.perf_counter()
+        for key in keys:
+            tree.search(key)
+        elapsed = time.perf_counter() - start
+        print("%-10s %d searches %.2fs (%.2f us each)" % (
+            name, accesses, elapsed, elapsed / accesses * 1e6))
+
+
+if __name__ == "__main__":
+    # Example usage:
+    tree = SplayTree()
+    tree.insert(10)
+    tree.insert(5)
+    tree.insert(20)
+    tree.insert(3)
+
+    print(tree.search(20))  # Output: True
+    print(tree.search(15))  # Output: False
+
+    # the benchmarks take a while, so they only run
+    # when asked for: python splay_search.py --bench
+    if "--bench" in sys.argv:
+        benchmark_splay()
@@ -17,17 +17,42 @@
 #  4e) After the splay procedure, make Root2 as the right child of
 # Root1 and return Root1.
 
+import heapq
+import itertools
+import random
+import sys
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from functools import lru_cache
+
 # Node class for splay tree
 class Node:
+    __slots__ = ('key', 'left', 'right', 'size')
+
     def __init__(self, key):
         self.key = key
         self.left = None
         self.right = None
+        # number of keys in the subtree rooted here
+        self.size = 1
+
+    # Recompute size from the children
+    def resize(self):
+        self.size = 1 + (self.left.size if self.left else 0) + \
+            (self.right.size if self.right else 0)
 
 # Splay tree class
 class SplayTree:
+    # Class of the nodes insert creates
+    node_class = Node
+
     def __init__(self):
         self.root = None
+        self.header = Node(None)
+
+    def __len__(self):
+        return self.root.size if self.root else 0
 
     # Function to search for a key in the splay tree and splay the accessed node to the root
     def search(self, key):
@@ -37,7 +62,7 @@ class SplayTree:
     # Function to insert a key into the splay tree
     def insert(self, key):
         if self.root is None:
-            self.root = Node(key)
+            self.root = self.node_class(key)
             return
 
         self.root = self.splay(self.root, key)
@@ -45,7 +70,7 @@ class SplayTree:
         if self.root.key == key:
             return
 
-        new_node = Node(key)
+        new_node = self.node_class(key)
 
         if key < self.root.key:
             new_node.right = self.root
@@ -56,6 +81,8 @@ class SplayTree:
             new_node.right = self.root.right
             self.root.right = None
 
+        self.root.resize()
+        new_node.resize()
         self.root = new_node
 
     # Function to delete a key from the splay tree
@@ -75,91 +102,623 @@ class SplayTree:
             self.root = self.root.left
             self.root = self.splay(self.root, key)
             self.root.right = temp
-
-    # Function to perform splay operation on the given key and return the new root
-    def splay(self, root, key):
-        if root is None or root.key == key:
-            return root
-
-        if key < root.key:
-            if root.left is None:
-                return root
-
-            if key < root.left.key:
-                root.left.left = self.splay(root.left.left, key)
-                root = self.rotate_right(root)
-            elif key > root.left.key:
-                root.left.right = self.splay(root.left.right, key)
-
-                if root.left.right is not None:
-                    root.left = self.rotate_left(root.left)
-
-            if root.left is not None:
-                return self.rotate_right(root)
-            else:
-                return root
-
+            self.root.resize()
+
+    # Splay the largest key of the tree under root to the top
+    def splay_max(self, root):
+        node = root
+        while node.right is not None:
+            node = node.right
+        return self.splay(root, node.key)
+
+    def splay_min(self, root):
+        node = root
+        while node.left is not None:
+            node = node.left
+        return self.splay(root, node.key)
+
+    # Function to split the tree at key: keys below key stay, and the keys from
+    # key up move to a new tree, which is returned. One splay brings the boundary
+    # to the root, and the split is cutting one of its links.
+    def split(self, key):
+        other = SplayTree()
+        if self.root is None:
+            return other
+        self.root = self.splay(self.root, key)
+        if self.root.key < key:
+            other.root = self.root.right
+            self.root.right = None
+            self.root.resize()
         else:
-            if root.right is None:
-                return root
-
-            if key < root.right.key:
-                root.right.left = self.splay(root.right.left, key)
-
-                if root.right.left is not None:
-                    root.right = self.rotate_right(root.right)
-            elif key > root.right.key:
-                root.right.right = self.splay(root.right.right, key)
-                root = self.rotate_left(root)
-
-            if root.right is not None:
-                return self.rotate_left(root)
+            other.root = self.root
+            self.root = self.root.left
+            other.root.left = None
+            other.root.resize()
+        return other
+
+    # Function to move every key of other, all of which must be larger than the
+    # keys here, into this tree: the largest key here is splayed to the root,
+    # which then has no right child to take other's root.
+    def join(self, other):
+        if other.root is None:
+            return
+        if self.root is None:
+            self.root, other.root = other.root, None
+            return
+        self.root = self.splay_max(self.root)
+        other.root = other.splay_min(other.root)
+        if other.root.key <= self.root.key:
+            raise ValueError("join needs every key of other above this tree's keys")
+        self.root.right = other.root
+        self.root.resize()
+        other.root = None
+
+    # Function to remove the keys in [lo, hi) and return them as a new tree,
+    # with two splits and a join instead of one delete per key
+    def extract_range(self, lo, hi):
+        middle = self.split(lo)
+        upper = middle.split(hi)
+        self.join(upper)
+        return middle
+
+    # Function to delete every key in [lo, hi)
+    def delete_range(self, lo, hi):
+        self.extract_range(lo, hi)
+
+    # Function to count the keys below key
+    def rank(self, key):
+        if self.root is None:
+            return 0
+        self.root = self.splay(self.root, key)
+        below = self.root.left.size if self.root.left else 0
+        return below + 1 if self.root.key < key else below
+
+    # Function to return the k-th smallest key, counting from 0. The walk down
+    # uses the sizes, and the key found is splayed so the cost stays amortized.
+    def select(self, k):
+        if not 0 <= k < len(self):
+            raise IndexError("select index out of range")
+        node = self.root
+        while True:
+            below = node.left.size if node.left else 0
+            if k < below:
+                node = node.left
+            elif k > below:
+                k -= below + 1
+                node = node.right
+            else:
+                break
+        self.root = self.splay(self.root, node.key)
+        return node.key
+
+    # Function to count the keys in [lo, hi)
+    def count_range(self, lo, hi):
+        if hi <= lo:
+            return 0
+        return self.rank(hi) - self.rank(lo)
+
+    # Function to perform splay operation on the given key and return the new root.
+    # Top-down in one pass: nodes passed on the way down are split off into a
+    # tree of smaller keys and a tree of larger ones, and the last node reached
+    # becomes the root with those two trees as its children.
+    # Sizes: a node rotated down keeps its subtree from then on, so it is
+    # resized at once. A node linked into a side tree only has its inner child
+    # replaced later, so those are resized after the pass, deepest first.
+    def splay(self, root, key):
+        if root is None:
+            return None
+        node = root
+        header = self.header
+        header.left = header.right = None
+        # left collects the keys below key, right those
+        # above, linked in at their max and min ends
+        left = right = header
+        linked = []
+        while True:
+            if key < node.key:
+                child = node.left
+                if child is None:
+                    break
+                if key < child.key:
+                    # zig-zig: rotate right first
+                    node.left = child.right
+                    child.right = node
+                    node.resize()
+                    node = child
+                    if node.left is None:
+                        break
+                right.left = node
+                right = node
+                linked.append(node)
+                node = node.left
+            elif key > node.key:
+                child = node.right
+                if child is None:
+                    break
+                if key > child.key:
+                    # zag-zag: rotate left first
+                    node.right = child.left
+                    child.left = node
+                    node.resize()
+                    node = child
+                    if node.right is None:
+                        break
+                left.right = node
+                left = node
+                linked.append(node)
+                node = node.right
             else:
-                return root
-
-    # Function to perform right rotation on the given node and return the new node
-    def rotate_right(self, node):
-        temp = node.left
-        node.left = temp.right
-        temp.right = node
-        return temp
-
-    # Function to perform left rotation on the given node and return the new node
-    def rotate_left(self, node):
-        temp = node.right
-        node.right = temp.left
-        temp.left = node
-        return temp
+                break
+        left.right = node.left
+        right.left = node.right
+        for side in reversed(linked):
+            side.resize()
+        node.left = header.right
+        node.right = header.left
+        node.resize()
+        return node
 
     # Function to print the splay tree in inorder traversal
     def inorder_traversal(self, node):
-        if node is not None:
-            self.inorder_traversal(node.left)
+        stack = []
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
             print(node.key, end=" ")
-            self.inorder_traversal(node.right)
+            node = node.right
 
-# Creating splay tree object
-splay_tree = SplayTree()
-# Inserting elements into splay tree
-splay_tree.insert(50)
-splay_tree.insert(30)
-splay_tree.insert(70)
-splay_tree.insert(20)
-splay_tree.insert(40)
-splay_tree.insert(80)
+# Node of a SplayCache, with the cached value and the
+# time of its last access
+class CacheNode(Node):
+    __slots__ = ('value', 'stamp')
 
-# Printing the splay tree before deletion
-print("Splay Tree before deletion:")
-splay_tree.inorder_traversal(splay_tree.root)
-print()
+    def __init__(self, key):
+        super().__init__(key)
+        self.value = None
+        self.stamp = 0
 
-# Deleting elements from splay tree
-splay_tree.delete(30)
-splay_tree.delete(80)
 
-# Printing the splay tree after deletion
-print("Splay Tree after deletion:")
-splay_tree.inorder_traversal(splay_tree.root)
+# Cache node for the "deep" policy, which also keeps the
+# levels in its subtree, updated by resize wherever the
+# sizes are
+class DeepCacheNode(CacheNode):
+    __slots__ = ('height',)
 
+    def __init__(self, key):
+        super().__init__(key)
+        self.height = 1
+
+    def resize(self):
+        left, right = self.left, self.right
+        self.size = 1 + (left.size if left else 0) + (right.size if right else 0)
+        self.height = 1 + max(left.height if left else 0, right.height if right else 0)
+
+
+# Bounded key -> value cache on a splay tree. Every get
+# and put splays its key to the root, so the keys in
+# use stay near the top and cold ones sink. When more
+# than capacity keys are held, one is evicted by policy:
+# "lru" evicts the key with the oldest access stamp,
+# found through a heap of (stamp, node) entries in which
+# stale entries are skipped; "deep" drops a deepest
+# leaf, found by following the taller child from the
+# root, since keys that sank to the bottom of a splay
+# tree are the ones not used for a while. It needs no
+# heap, only subtree heights, kept next to the sizes
+# through every splay. insert(key) is put(key, None); split, join
+# and the range methods of SplayTree skip the stamps
+# and the bound, and are not for use on a cache.
+class SplayCache(SplayTree):
+    node_class = CacheNode
+
+    def __init__(self, capacity, policy="lru", seed=None):
+        super().__init__()
+        if policy not in ("lru", "deep"):
+            raise ValueError("policy must be 'lru' or 'deep'")
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.policy = policy
+        if policy == "deep":
+            self.node_class = DeepCacheNode
+        self.clock = 0
+        self.heap = []
+        self.rng = random.Random(seed)
+        self.hits = self.misses = self.evictions = 0
+
+    def _touch(self, node):
+        self.clock += 1
+        node.stamp = self.clock
+        if self.policy == "lru":
+            heapq.heappush(self.heap, (node.stamp, node))
+            if len(self.heap) > 4 * self.capacity + 16:
+                self._compact()
+
+    # Drop the stale heap entries, keeping one per key
+    def _compact(self):
+        self.heap = []
+        stack, node = [], self.root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            self.heap.append((node.stamp, node))
+            node = node.right
+        heapq.heapify(self.heap)
+
+    def get(self, key, default=None):
+        if self.root is not None:
+            self.root = self.splay(self.root, key)
+            if self.root.key == key:
+                self.hits += 1
+                self._touch(self.root)
+                return self.root.value
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        present = False
+        if self.root is not None:
+            self.root = self.splay(self.root, key)
+            present = self.root.key == key
+        super().insert(key)
+        self.root.value = value
+        self._touch(self.root)
+        if not present:
+            while len(self) > self.capacity:
+                self._evict()
 
+    def insert(self, key):
+        self.put(key, None)
 
+    def delete(self, key):
+        if self.root is None:
+            return
+        self.root = self.splay(self.root, key)
+        if self.root.key == key:
+            self.root.stamp = -1
+            super().delete(key)
+
+    def _evict(self):
+        self.evictions += 1
+        if self.policy == "lru":
+            while True:
+                stamp, node = heapq.heappop(self.heap)
+                # skip entries older than the node's last access
+                # and entries of nodes already gone
+                if node.stamp == stamp:
+                    self.delete(node.key)
+                    return
+        # the root was just put and has company, so the
+        # deepest leaf is always below it. Ties between
+        # equally tall children are broken at random.
+        path, node = [], self.root
+        while node.left is not None or node.right is not None:
+            path.append(node)
+            left = node.left.height if node.left else 0
+            right = node.right.height if node.right else 0
+            if left > right or (left == right and self.rng.random() < 0.5):
+                node = node.left
+            else:
+                node = node.right
+        parent = path[-1]
+        if parent.left is node:
+            parent.left = None
+        else:
+            parent.right = None
+        node.stamp = -1
+        for node in reversed(path):
+            node.resize()
+
+
+# Keys under node in order, without recursion
+def inorder_keys(node):
+    keys, stack = [], []
+    while stack or node is not None:
+        while node is not None:
+            stack.append(node)
+            node = node.left
+        node = stack.pop()
+        keys.append(node.key)
+        node = node.right
+    return keys
+
+
+# Random range removals, splits and joins against a
+# sorted list of the same keys
+def check_range_operations(seed=0):
+    rng = random.Random(seed)
+    for _ in range(200):
+        tree, model = SplayTree(), set()
+        for key in rng.sample(range(200), rng.randrange(60)):
+            tree.insert(key)
+            model.add(key)
+        lo = rng.randrange(210)
+        hi = rng.randrange(lo, 211)
+        taken = tree.extract_range(lo, hi)
+        assert inorder_keys(taken.root) == sorted(k for k in model if lo <= k < hi)
+        model = {k for k in model if not lo <= k < hi}
+        assert inorder_keys(tree.root) == sorted(model)
+        key = rng.randrange(210)
+        upper = tree.split(key)
+        assert inorder_keys(tree.root) == sorted(k for k in model if k < key)
+        assert inorder_keys(upper.root) == sorted(k for k in model if k >= key)
+        tree.join(upper)
+        assert inorder_keys(tree.root) == sorted(model) and upper.root is None
+    print("range operations match the sorted keys")
+
+
+# Subtree sizes of every node, recounted from scratch,
+# against the sizes kept through the splays
+def _sizes_consistent(node):
+    if node is None:
+        return True
+    stack, order = [node], []
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        stack.extend(child for child in (node.left, node.right) if child)
+    for node in reversed(order):
+        expected = 1 + (node.left.size if node.left else 0) + \
+            (node.right.size if node.right else 0)
+        if node.size != expected:
+            return False
+    return True
+
+
+# rank, select and count_range under random inserts,
+# deletes, splits and range removals, against a sorted
+# list of the keys
+def check_order_statistics(seed=0):
+    rng = random.Random(seed)
+    for _ in range(40):
+        tree, model = SplayTree(), []
+        for _ in range(300):
+            op = rng.random()
+            key = rng.randrange(500)
+            if op < 0.5:
+                if key not in model:
+                    tree.insert(key)
+                    model.insert(bisect_left(model, key), key)
+            elif op < 0.75:
+                tree.delete(key)
+                if key in model:
+                    model.remove(key)
+            elif op < 0.8:
+                upper = tree.split(key)
+                assert len(upper) == len(model) - bisect_left(model, key)
+                tree.join(upper)
+            elif op < 0.82:
+                hi = key + rng.randrange(50)
+                tree.delete_range(key, hi)
+                model = [k for k in model if not key <= k < hi]
+            assert len(tree) == len(model)
+            assert tree.rank(key) == bisect_left(model, key)
+            hi = rng.randrange(500)
+            assert tree.count_range(key, hi) == \
+                max(0, bisect_left(model, hi) - bisect_left(model, key))
+            if model:
+                k = rng.randrange(len(model))
+                assert tree.select(k) == model[k]
+            assert _sizes_consistent(tree.root)
+    print("order statistics match the sorted keys")
+
+
+# Rank and select on a leaderboard of scores, against
+# finding positions in the in-order list of keys
+def benchmark_order_statistics(n=100000, queries=20000):
+    rng = random.Random(12)
+    scores = rng.sample(range(10 ** 9), n)
+    tree = SplayTree()
+    start = time.perf_counter()
+    for score in scores:
+        tree.insert(score)
+    built = time.perf_counter() - start
+    probes = [rng.randrange(10 ** 9) for _ in range(queries)]
+    positions = [rng.randrange(n) for _ in range(queries)]
+
+    start = time.perf_counter()
+    ranks = [tree.rank(score) for score in probes]
+    picked = [tree.select(k) for k in positions]
+    queried = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in range(20):
+        keys = inorder_keys(tree.root)
+        assert bisect_left(keys, probes[i]) == ranks[i]
+        assert keys[positions[i]] == picked[i]
+    flattened = (time.perf_counter() - start) * queries / 20
+    print("%d scores: build %.2fs, %d rank + %d select %.2fs, "
+          "through the in-order list ~%.0fs" % (n, built, queries, queries, queried, flattened))
+
+
+# Random get, put and delete: the lru policy against an
+# OrderedDict, and the deep policy for its bound, its
+# sizes and heights, and evicting only from the bottom
+def check_splay_cache(seed=0):
+    rng = random.Random(seed)
+    for capacity in (1, 2, 5, 30):
+        cache, model = SplayCache(capacity, "lru"), OrderedDict()
+        for step in range(2000):
+            key, op = rng.randrange(3 * capacity + 3), rng.random()
+            if op < 0.4:
+                expected = model.get(key)
+                if key in model:
+                    model.move_to_end(key)
+                assert cache.get(key) == expected
+            elif op < 0.9:
+                cache.put(key, step)
+                model[key] = step
+                model.move_to_end(key)
+                if len(model) > capacity:
+                    model.popitem(last=False)
+            else:
+                cache.delete(key)
+                model.pop(key, None)
+            assert inorder_keys(cache.root) == sorted(model)
+
+        cache = SplayCache(capacity, "deep", seed)
+        evict = cache._evict
+
+        # the evicted key was as deep as any in the tree
+        def watched():
+            depths = _depths(cache.root)
+            evict()
+            gone, = set(depths) - set(inorder_keys(cache.root))
+            assert depths[gone] == max(depths.values())
+        cache._evict = watched
+        for step in range(2000):
+            key = rng.randrange(3 * capacity + 3)
+            if rng.random() < 0.5:
+                cache.get(key)
+                continue
+            cache.put(key, step)
+            assert len(cache) <= capacity and _sizes_consistent(cache.root)
+            assert all(node.height == 1 + max(node.left.height if node.left else 0,
+                                              node.right.height if node.right else 0)
+                       for node in _nodes(cache.root))
+    print("splay cache matches the OrderedDict and evicts from the bottom")
+
+
+def _nodes(node):
+    stack, nodes = [node] if node else [], []
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        stack.extend(child for child in (node.left, node.right) if child)
+    return nodes
+
+
+# Depth of every key under node
+def _depths(node):
+    depths, stack = {}, [(node, 0)] if node else []
+    while stack:
+        node, depth = stack.pop()
+        depths[node.key] = depth
+        stack.extend((child, depth + 1) for child in (node.left, node.right) if child)
+    return depths
+
+
+# Removing a range of keys one delete at a time against
+# delete_range
+def benchmark_delete_range(n=200000, width=50000):
+    keys = list(range(n))
+    random.Random(12).shuffle(keys)
+    timings = []
+    for bulk in (False, True):
+        tree = SplayTree()
+        for key in keys:
+            tree.insert(key)
+        start = time.perf_counter()
+        if bulk:
+            tree.delete_range(n // 4, n // 4 + width)
+        else:
+            for key in range(n // 4, n // 4 + width):
+                tree.delete(key)
+        timings.append(time.perf_counter() - start)
+    print("removing %d of %d keys: one by one %.3fs, delete_range %.3fs" % (
+        width, n, timings[0], timings[1]))
+
+
+# Hit rate and time on a Zipf-skewed trace of keys,
+# loading a missed key and putting it in the cache:
+# SplayCache with both policies against an
+# OrderedDict LRU and functools.lru_cache
+def benchmark_splay_cache(keys=100000, accesses=200000, capacity=2000):
+    rng = random.Random(13)
+    weights = list(itertools.accumulate(1 / (rank + 1) ** 1.1 for rank in range(keys)))
+    hot = list(range(keys))
+    rng.shuffle(hot)
+    trace = rng.choices(hot, cum_weights=weights, k=accesses)
+
+    def load(key):
+        return key * 2
+
+    for policy in ("lru", "deep"):
+        cache = SplayCache(capacity, policy, seed=1)
+        start = time.perf_counter()
+        for key in trace:
+            if cache.get(key) is None:
+                cache.put(key, load(key))
+        elapsed = time.perf_counter() - start
+        print("SplayCache %-4s hit rate %.3f, %d evictions, %.2fs" % (
+            policy, cache.hits / accesses, cache.evictions, elapsed))
+
+    ordered, hits = OrderedDict(), 0
+    start = time.perf_counter()
+    for key in trace:
+        if key in ordered:
+            ordered.move_to_end(key)
+            hits += 1
+        else:
+            ordered[key] = load(key)
+            if len(ordered) > capacity:
+                ordered.popitem(last=False)
+    elapsed = time.perf_counter() - start
+    print("OrderedDict     hit rate %.3f, %.2fs" % (hits / accesses, elapsed))
+
+    cached = lru_cache(maxsize=capacity)(load)
+    start = time.perf_counter()
+    for key in trace:
+        cached(key)
+    elapsed = time.perf_counter() - start
+    print("lru_cache       hit rate %.3f, %.2fs" % (cached.cache_info().hits / accesses, elapsed))
+
+
+if __name__ == "__main__":
+    # Creating splay tree object
+    splay_tree = SplayTree()
+    # Inserting elements into splay tree
+    splay_tree.insert(50)
+    splay_tree.insert(30)
+    splay_tree.insert(70)
+    splay_tree.insert(20)
+    splay_tree.insert(40)
+    splay_tree.insert(80)
+
+    # Printing the splay tree before deletion
+    print("Splay Tree before deletion:")
+    splay_tree.inorder_traversal(splay_tree.root)
+    print()
+
+    # Deleting elements from splay tree
+    splay_tree.delete(30)
+    splay_tree.delete(80)
+
+    # Printing the splay tree after deletion
+    print("Splay Tree after deletion:")
+    splay_tree.inorder_traversal(splay_tree.root)
+
+    # Cut out [40, 60), then join the two halves of a split
+    taken = splay_tree.extract_range(40, 60)
+    print("\nExtracted:", inorder_keys(taken.root), "left:", inorder_keys(splay_tree.root))
+    upper = splay_tree.split(50)
+    splay_tree.join(upper)
+    print("Split and joined:", inorder_keys(splay_tree.root))
+
+    # A cache of two entries: getting 1 makes 2 the
+    # least recently used, so putting 3 evicts 2
+    cache = SplayCache(2)
+    cache.put(1, "one")
+    cache.put(2, "two")
+    cache.get(1)
+    cache.put(3, "three")
+    print(cache.get(2), cache.get(1), cache.hits, cache.misses, cache.evictions)  # None one 2 1 1
+
+    # Leaderboard positions over the keys 20 and 70 left:
+    # one key is below 40, the smallest is 20, and both
+    # lie in [20, 75)
+    print(len(splay_tree), splay_tree.rank(40), splay_tree.select(0),
+          splay_tree.count_range(20, 75))  # 2 1 20 2
+
+    check_range_operations()
+    check_order_statistics()
+    check_splay_cache()
+    # the benchmarks take a while, so they only run
+    # when asked for: python splay_tree_del.py --bench
+    if "--bench" in sys.argv:
+        benchmark_delete_range()
+        benchmark_splay_cache()
+        benchmark_order_statistics()
@@ -27,6 +27,8 @@
 
 
 class Node:
+    __slots__ = ('key', 'left', 'right')
+
     def __init__(self, key):
         self.key = key
         self.left = None
@@ -36,67 +38,55 @@ class Node:
 class SplayTree:
     def __init__(self):
         self.root = None
+        self.header = Node(None)
 
-    # Function to perform a zig rotation
-    def zig(self, x):
-        y = x.left
-        x.left = y.right
-        y.right = x
-        return y
-
-    # Function to perform a zag rotation
-    def zag(self, x):
-        y = x.right
-        x.right = y.left
-        y.left = x
-        return y
-
-    # Function to perform splay operation
+    # Function to perform splay operation, top-down in one pass with the
+    # rotations done in place
     def splay(self, key):
         if self.root is None or self.root.key == key:
             return
-
-        dummy = Node(None)
-        left_tree = dummy
-        right_tree = dummy
-        curr = self.root
-
+        node = self.root
+        header = self.header
+        header.left = header.right = None
+        # left collects the keys below key, right those
+        # above, linked in at their max and min ends
+        left = right = header
         while True:
-            if key < curr.key:
-                if curr.left is None:
-                    break
-                if key < curr.left.key:
-                    curr = self.zig(curr)
-
-                if curr.left is None:
+            if key < node.key:
+                child = node.left
+                if child is None:
                     break
-
-                right_tree.left = curr
-                right_tree = curr
-                curr = curr.left
-                right_tree.left = None
-            elif key > curr.key:
-                if curr.right is None:
-                    break
-                if key > curr.right.key:
-                    curr = self.zag(curr)
-
-                if curr.right is None:
+                if key < child.key:
+                    # zig-zig: rotate right first
+                    node.left = child.right
+                    child.right = node
+                    node = child
+                    if node.left is None:
+                        break
+                right.left = node
+                right = node
+                node = node.left
+            elif key > node.key:
+                child = node.right
+                if child is None:
                     break
-
-                left_tree.right = curr
-                left_tree = curr
-                curr = curr.right
-                left_tree.right = None
+                if key > child.key:
+                    # zag-zag: rotate left first
+                    node.right = child.left
+                    child.left = node
+                    node = child
+                    if node.right is None:
+                        break
+                left.right = node
+                left = node
+                node = node.right
             else:
                 break
-
-        left_tree.right = curr.left
-        right_tree.left = curr.right
-        curr.left = dummy.right
-        curr.right = dummy.left
-
-        self.root = curr
+        left.right = node.left
+        right.left = node.right
+        node.left = header.right
+        node.right = header.left
+        self.root = node
 
     # Function to insert a new element in the splay tree
     def insert(self, key):
@@ -119,11 +109,14 @@ class SplayTree:
 
     # Function to print the elements of the splay tree (in-order traversal)
     def inorder(self, node):
-        if node is None:
-            return
-        self.inorder(node.left)
-        print(node.key, end=" ")
-        self.inorder(node.right)
+        stack = []
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            print(node.key, end=" ")
+            node = node.right
 
 # Test the program
 splay_tree = SplayTree()